@@ -0,0 +1,133 @@
+import io
+import os
+import tarfile
+import threading
+import zipfile
+
+# путь к файлу внутри архива: "school.tar.gz::school/019_02__x.txt.webRes"
+MEMBER_SEPARATOR = '::'
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+
+def is_tar_archive(path):
+    # tar (в том числе сжатый) читается только потоком: оглавление стоит полной распаковки
+    return is_archive(path) and not path.lower().endswith('.zip')
+
+
+def member_path(archive_path, name):
+    return f"{archive_path}{MEMBER_SEPARATOR}{name}"
+
+
+def split_member_path(path):
+    # (архив, имя в архиве) или (path, None) для обычного файла
+    archive_path, separator, name = path.partition(MEMBER_SEPARATOR)
+    if not separator:
+        return path, None
+    return archive_path, name
+
+
+def is_member_path(path):
+    return MEMBER_SEPARATOR in path
+
+
+def source_basename(path):
+    # имя файла без папок - и для обычного файла, и для члена архива
+    archive_path, name = split_member_path(path)
+    return os.path.basename(name if name is not None else archive_path)
+
+
+class ArchiveIndex:
+    # оглавление tar/zip за один проход по заголовкам; файлы читаются по имени без распаковки на диск.
+    # Чтение идет под замком: один объект архива используют потоки декодирования изображений.
+    # У сжатого tar переход назад по архиву - распаковка с начала, поэтому файлы выгоднее
+    # читать в порядке архива, в котором их и выдает names()
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if path.lower().endswith('.zip'):
+            self.archive = zipfile.ZipFile(path)
+            self.members = {info.filename: info for info in self.archive.infolist() if not info.is_dir()}
+        else:
+            self.archive = tarfile.open(path, 'r:*')
+            self.members = {member.name: member for member in self.archive.getmembers() if member.isfile()}
+
+    def names(self):
+        return list(self.members)
+
+    def read(self, name):
+        member = self.members.get(name)
+        if member is None:
+            raise FileNotFoundError(f"Нет файла {name} в архиве {self.path}")
+        with self.lock:
+            if isinstance(self.archive, zipfile.ZipFile):
+                return self.archive.read(member)
+            return self.archive.extractfile(member).read()
+
+    def close(self):
+        self.archive.close()
+
+
+# открытые архивы по (процесс, путь): после fork процесс-обработчик открывает свой,
+# позиция чтения в унаследованном файле общая с родителем
+archives = {}
+archives_lock = threading.Lock()
+
+
+def get_archive(path):
+    key = (os.getpid(), path)
+    archive = archives.get(key)
+    if archive is None:
+        with archives_lock:
+            archive = archives.get(key)
+            if archive is None:
+                archive = archives[key] = ArchiveIndex(path)
+    return archive
+
+
+def list_sources(location, suffix):
+    # файлы с окончанием suffix в папке (по имени) или в архиве (в порядке архива);
+    # для архива - пути вида архив::имя
+    if is_archive(location):
+        archive = get_archive(location)
+        return [member_path(location, name) for name in archive.names() if name.endswith(suffix)]
+    return [os.path.join(location, name) for name in sorted(os.listdir(location)) if name.endswith(suffix)]
+
+
+def read_source(path):
+    archive_path, name = split_member_path(path)
+    if name is None:
+        with open(path, 'rb') as f:
+            return f.read()
+    return get_archive(archive_path).read(name)
+
+
+def iter_source_contents(location, suffix):
+    # (путь, байты) файлов с окончанием suffix за один проход, в порядке папки или архива.
+    # tar читается потоком ('r|*'): без оглавления и без возвратов, сжатый распаковывается один раз
+    if not is_archive(location):
+        for path in list_sources(location, suffix):
+            with open(path, 'rb') as f:
+                yield path, f.read()
+    elif location.lower().endswith('.zip'):
+        with zipfile.ZipFile(location) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(suffix):
+                    yield member_path(location, info.filename), archive.read(info)
+    else:
+        with tarfile.open(location, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(suffix):
+                    yield member_path(location, member.name), archive.extractfile(member).read()
+
+
+def open_text(path, content=None):
+    # текстовый поток файла или члена архива; content - уже прочитанные байты члена
+    if content is None:
+        if not is_member_path(path):
+            return open(path, 'r', encoding='utf-8')
+        content = read_source(path)
+    return io.TextIOWrapper(io.BytesIO(content), encoding='utf-8')
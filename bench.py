@@ -0,0 +1,448 @@
+# python bench.py --output bench.json
+# python bench.py --scale 0.2 --stages levenshtein webres_parse
+# python bench.py --baseline bench.json --output bench_new.json
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from levenshtein import closest_word, levenshtein
+from levenshtein_batch import closest_word_batch, pack_length_dict
+from results_store import parse_legacy, write_legacy
+from webres_stream import iter_text_boxes
+
+SEED_WEBRES = "input.txt.webRes"
+SEED_RESULTS = "results.txt"
+MODEL_FILE = "classification_model.joblib"
+STARTUP_RUNS = 5  # запусков отдельного процесса на замер старта day4
+BENCH_VERSION = 1
+
+# размеры при --scale 1
+SIZES = {
+    'pairs': 20000,  # пар слов для levenshtein
+    'queries': 50,  # слов с опечатками для поиска по словарю
+    'pages': 10,  # синтетических страниц webRes
+    'boxes': 100,  # текстовых боксов на странице
+    'works': 2000,  # работ в синтетическом results.txt
+}
+TASKS = list(range(22, 29))
+WORD_PATTERN = re.compile(r'[а-яё]{2,}')
+RUSSIAN_LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def measure(fn, items, memory=True, warmup=3):
+    # задержка каждого вызова, пропускная способность и пик памяти Python-объектов.
+    # Память считается отдельным проходом: tracemalloc заметно замедляет сами вызовы
+    for item in items[:warmup]:
+        fn(item)
+
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_start)
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        'items': len(items),
+        'total_s': round(total, 4),
+        'throughput': round(len(items) / total, 2) if total else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4),
+        'max_ms': round(latencies[-1] * 1000, 4),
+    }
+
+    if memory:
+        tracemalloc.start()
+        for item in items:
+            fn(item)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_alloc_mb'] = round(peak / 2 ** 20, 3)
+
+    return result
+
+
+def misspell(word, rng, edits=1):
+    # случайные опечатки: пропуск, вставка, замена или перестановка соседних букв
+    for _ in range(edits):
+        i = rng.randrange(len(word))
+        kind = rng.randrange(4)
+        if kind == 0 and len(word) > 2:
+            word = word[:i] + word[i + 1:]
+        elif kind == 1:
+            word = word[:i] + rng.choice(RUSSIAN_LETTERS) + word[i:]
+        elif kind == 2:
+            word = word[:i] + rng.choice(RUSSIAN_LETTERS) + word[i + 1:]
+        elif i + 1 < len(word):
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+class BenchData:
+    # синтетические данные по образцу input.txt.webRes и results.txt во временной папке
+    def __init__(self, sizes, seed, workdir):
+        self.sizes = sizes
+        self.seed = seed
+        self.workdir = workdir
+
+        self.pages = list(parse_legacy(SEED_RESULTS))
+        self.texts = [text for _, tasks in self.pages for _, text in tasks]
+        words = []
+        seen = set()
+        for text in self.texts:
+            for word in WORD_PATTERN.findall(text.lower()):
+                if word not in seen:
+                    seen.add(word)
+                    words.append(word)
+        self.vocabulary = words
+
+    def rng(self, name):
+        # свой генератор на каждый вид данных: данные этапа не зависят от набора --stages
+        return random.Random(f'{self.seed}:{name}')
+
+    def word_pairs(self):
+        rng = self.rng('pairs')
+        return [(misspell(word, rng, rng.randint(1, 2)), rng.choice(self.vocabulary))
+                for word in rng.choices(self.vocabulary, k=self.sizes['pairs'])]
+
+    def queries(self):
+        rng = self.rng('queries')
+        candidates = [word for word in self.vocabulary if len(word) >= 4]
+        return [misspell(word, rng, rng.randint(1, 2)) for word in rng.choices(candidates, k=self.sizes['queries'])]
+
+    def dictionary_file(self):
+        path = os.path.join(self.workdir, 'dictionary.txt')
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(self.vocabulary) + '\n')
+        return path
+
+    def webres_pages(self):
+        # боксы образца копируются с новыми текстами и координатами; строение страницы то же
+        if hasattr(self, '_webres_pages'):
+            return self._webres_pages
+
+        with open(SEED_WEBRES, 'r', encoding='utf-8') as f:
+            seed = json.load(f)
+        seed_boxes = [box for block in seed['data']['blocks'] for box in block.get('boxes', [])
+                      if box.get('languages')]
+
+        rng = self.rng('pages')
+        pages = []
+        for page in range(self.sizes['pages']):
+            boxes = []
+            for i in range(self.sizes['boxes']):
+                box = copy.deepcopy(seed_boxes[i % len(seed_boxes)])
+                box['x'] = rng.randrange(0, 2000)
+                box['y'] = rng.randrange(0, 2800)
+                box['w'] = rng.randrange(50, 600)
+                box['h'] = rng.randrange(20, 80)
+                text = ' '.join(misspell(word, rng) if rng.random() < 0.2 else word
+                                for word in rng.choice(self.texts).split()[:12])
+                for language in box['languages']:
+                    for item in language.get('texts', []):
+                        item['text'] = text
+                boxes.append(box)
+
+            page_data = copy.deepcopy(seed)
+            page_data['data']['blocks'] = [dict(seed['data']['blocks'][0], boxes=boxes)]
+            path = os.path.join(self.workdir, f'page_{page:04d}.webRes')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(page_data, f, ensure_ascii=False)
+            pages.append(path)
+
+        self._webres_pages = pages
+        return pages
+
+    def layouts(self):
+        # (боксы текстов, YOLO-боксы заданий) для каждой страницы; задания - горизонтальные полосы
+        names = {i: f'Задание {task}' for i, task in enumerate(TASKS)}
+        layouts = []
+        for path in self.webres_pages():
+            with open(path, 'r', encoding='utf-8') as f:
+                text_boxes = list(iter_text_boxes(f))
+            yolo_boxes = []
+            for i in range(len(TASKS)):
+                yolo_boxes.append({'x1': 0, 'y1': i * 400, 'x2': 2600, 'y2': (i + 1) * 400 + 20,
+                                   'label': i, 'conf': 0.9})
+            layouts.append((text_boxes, yolo_boxes))
+        return names, layouts
+
+    def results_file(self):
+        path = os.path.join(self.workdir, 'results.txt')
+        if not os.path.exists(path):
+            rng = self.rng('works')
+            grouped = {}
+            for work in range(self.sizes['works']):
+                tasks = {str(task): rng.choice(self.texts) for task in TASKS if rng.random() < 0.8}
+                grouped[f'{1000000000 + work}_01'] = tasks
+            write_legacy(grouped, path)
+        return path
+
+
+def bench_levenshtein(data, memory):
+    return measure(lambda pair: levenshtein(*pair), data.word_pairs(), memory)
+
+
+def bench_closest_word(data, memory):
+    vocabulary = data.vocabulary
+    result = measure(lambda word: closest_word(word, vocabulary), data.queries(), memory)
+    result['vocabulary'] = len(vocabulary)
+    return result
+
+
+def bench_closest_word_batch(data, memory):
+    length_dict = defaultdict(list)
+    for word in data.vocabulary:
+        length_dict[len(word)].append(word)
+    packed = pack_length_dict(length_dict)
+
+    def lookup(word):
+        lengths = [length for length in range(len(word) - 2, len(word) + 3) if length > 0]
+        return closest_word_batch(word, packed, lengths)
+
+    result = measure(lookup, data.queries(), memory)
+    result['vocabulary'] = len(data.vocabulary)
+    return result
+
+
+def bench_symspell(data, memory):
+    from symspellpy import Verbosity
+    from spell_index import build_symspell
+
+    start = time.perf_counter()
+    sym_spell = build_symspell(data.dictionary_file(), 2, 7, word_list=True)
+    build_s = time.perf_counter() - start
+
+    queries = data.queries() * 20
+    result = measure(lambda word: sym_spell.lookup(word, Verbosity.CLOSEST, max_edit_distance=2), queries, memory)
+    result['build_s'] = round(build_s, 4)
+    return result
+
+
+def bench_symspell_compact(data, memory):
+    from symspellpy import Verbosity
+    from compact_index import load_or_build_compact_index
+
+    index_path = os.path.join(data.workdir, 'dictionary.compact')
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    start = time.perf_counter()
+    index = load_or_build_compact_index(data.dictionary_file(), 2, 7, word_list=True, index_path=index_path)
+    build_s = time.perf_counter() - start
+    index.close()
+
+    start = time.perf_counter()
+    index = load_or_build_compact_index(data.dictionary_file(), 2, 7, word_list=True, index_path=index_path)
+    load_s = time.perf_counter() - start
+
+    queries = data.queries() * 20
+    result = measure(lambda word: index.lookup(word, Verbosity.CLOSEST, max_edit_distance=2), queries, memory)
+    result['build_s'] = round(build_s, 4)
+    result['load_s'] = round(load_s, 4)
+    index.close()
+    return result
+
+
+def bench_webres_parse(data, memory):
+    def parse(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return sum(1 for _ in iter_text_boxes(f))
+
+    pages = data.webres_pages()
+    result = measure(parse, pages, memory)
+    total_mb = sum(os.path.getsize(path) for path in pages) / 2 ** 20
+    result['mb_per_s'] = round(total_mb / result['total_s'], 2)
+    result['boxes_per_page'] = data.sizes['boxes']
+    return result
+
+
+def import_day4():
+    # словарь и YOLO day4LastVers загружает при первом обращении: без них этапы day4 пропускаются
+    import day4LastVers
+    return day4LastVers
+
+
+def run_process(command):
+    # новый процесс на каждый запуск: в этом процессе модули уже лежат в sys.modules
+    result = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, encoding='utf-8')
+    if result.returncode:
+        lines = result.stderr.strip().splitlines() or [f"код возврата {result.returncode}"]
+        raise OSError(lines[-1])
+
+
+def bench_day4_import(data, memory):
+    # время импорта day4LastVers: до ленивой загрузки сюда входили индекс SymSpell и torch
+    command = [sys.executable, '-c', 'import day4LastVers']
+    return measure(lambda _: run_process(command), [None] * STARTUP_RUNS, memory=False, warmup=1)
+
+
+def bench_day4_pairs(data, memory):
+    # полный запуск подкоманды pairs, которой не нужны ни словарь, ни модель
+    empty_dir = os.path.join(data.workdir, 'empty')
+    os.makedirs(empty_dir, exist_ok=True)
+    command = [sys.executable, 'day4LastVers.py', 'pairs', '--webres-dir', empty_dir, '--images-dir', empty_dir]
+    return measure(lambda _: run_process(command), [None] * STARTUP_RUNS, memory=False, warmup=1)
+
+
+def bench_extract(data, memory):
+    day4 = import_day4()
+    return measure(day4.extract_text_from_webres, data.webres_pages(), memory)
+
+
+def bench_match(data, memory):
+    day4 = import_day4()
+    names, layouts = data.layouts()
+    # названия классов берутся из синтетической разметки, а не из модели
+    result = measure(lambda layout: day4.match_text_to_tasks(*layout, names), layouts * 20, memory)
+    result['boxes_per_page'] = data.sizes['boxes']
+    return result
+
+
+def grade_stage(data, memory, model_path):
+    import day5
+
+    results_data = day5.parse_results(data.results_file())
+    model = day5.load_model(model_path)
+    works = list(results_data.values())
+    result = measure(lambda tasks: day5.grade_items(model, day5.work_items(tasks)), works, memory)
+
+    # вся пачка работ за один проход, как в predict_grades
+    start = time.perf_counter()
+    for _ in day5.iter_work_grades(model, results_data):
+        pass
+    result['batch_works_per_s'] = round(len(works) / (time.perf_counter() - start), 2)
+    return result
+
+
+def bench_grade_pipeline(data, memory):
+    if not os.path.exists(MODEL_FILE):
+        raise FileNotFoundError(MODEL_FILE)
+    return grade_stage(data, memory, MODEL_FILE)
+
+
+def bench_grade_arrays(data, memory):
+    if not os.path.exists(MODEL_FILE):
+        raise FileNotFoundError(MODEL_FILE)
+    import joblib
+    from linear_scorer import export_linear_model
+
+    export_dir = os.path.join(data.workdir, 'model_arrays')
+    if not os.path.exists(export_dir):
+        export_linear_model(joblib.load(MODEL_FILE), export_dir)
+    return grade_stage(data, memory, export_dir)
+
+
+STAGES = {
+    'levenshtein': bench_levenshtein,
+    'closest_word': bench_closest_word,
+    'closest_word_batch': bench_closest_word_batch,
+    'symspell': bench_symspell,
+    'symspell_compact': bench_symspell_compact,
+    'webres_parse': bench_webres_parse,
+    'day4_import': bench_day4_import,
+    'day4_pairs': bench_day4_pairs,
+    'extract': bench_extract,
+    'match': bench_match,
+    'grade_pipeline': bench_grade_pipeline,
+    'grade_arrays': bench_grade_arrays,
+}
+
+
+def run_benchmarks(stages, sizes, seed, memory=True):
+    report = {
+        'version': BENCH_VERSION,
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'sizes': sizes,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'stages': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='bench_') as workdir:
+        data = BenchData(sizes, seed, workdir)
+        for name in stages:
+            print(f"{name}...", end=' ', flush=True)
+            try:
+                result = STAGES[name](data, memory)
+            except (ImportError, OSError) as e:
+                # нет пакета, модели или словаря - этап пропускается, остальные идут дальше
+                result = {'skipped': f"{type(e).__name__}: {e}"}
+                print("пропущен")
+            else:
+                print(f"{result['throughput']}/с, p50 {result['p50_ms']} мс, p99 {result['p99_ms']} мс")
+            report['stages'][name] = result
+
+    return report
+
+
+def compare(report, baseline, threshold):
+    # изменение пропускной способности и p99 относительно базового отчета;
+    # регрессия - падение пропускной способности больше threshold
+    regressions = []
+    print(f"\n{'этап':<20} {'база, /с':>12} {'сейчас, /с':>12} {'изм.':>8} {'p99 база':>10} {'p99 сейчас':>10}")
+    for name, result in report['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or 'skipped' in base or 'skipped' in result:
+            continue
+        change = result['throughput'] / base['throughput'] - 1
+        flag = ''
+        if change < -threshold:
+            regressions.append(name)
+            flag = ' !'
+        print(f"{name:<20} {base['throughput']:>12} {result['throughput']:>12} {change:>+8.1%} "
+              f"{base['p99_ms']:>10} {result['p99_ms']:>10}{flag}")
+
+    if baseline.get('meta', {}).get('sizes') != report['meta']['sizes']:
+        print("Внимание: размеры данных в базовом отчете другие, сравнение приблизительное")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Замеры горячих участков: опечатки, разбор webRes, сопоставление, оценка.')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help='Какие этапы замерять')
+    parser.add_argument('--scale', type=float, default=1.0, help='Множитель размеров синтетических данных')
+    parser.add_argument('--seed', type=int, default=42, help='Зерно генератора данных')
+    parser.add_argument('--no-memory', action='store_true', help='Не замерять пик памяти (вдвое быстрее)')
+    parser.add_argument('--output', default='bench.json', help='Файл для JSON-отчета')
+    parser.add_argument('--baseline', help='Базовый JSON-отчет для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Допустимое падение пропускной способности относительно базы (0.1 = 10%%)')
+
+    args = parser.parse_args()
+
+    sizes = {name: max(1, int(size * args.scale)) for name, size in SIZES.items()}
+    report = run_benchmarks(args.stages, sizes, args.seed, memory=not args.no_memory)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nОтчет сохранен в {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Регрессии: {', '.join(regressions)}")
+            sys.exit(1)
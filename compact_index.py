@@ -0,0 +1,363 @@
+# python compact_index.py --dictionary ru_full.txt --max-edit-distance 3 --prefix-length 7
+import argparse
+import array
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from symspellpy import Verbosity
+from symspellpy.suggest_item import SuggestItem
+
+from levenshtein import damerau_osa
+from spell_index import default_index_path, index_header, load_or_build_symspell
+
+MAGIC = b'SSCI'
+COMPACT_VERSION = 1
+SECTIONS = ('word_offsets', 'word_blob', 'counts', 'delete_hashes', 'posting_offsets', 'postings')
+SECTION_FORMATS = {
+    'word_offsets': 'I',
+    'word_blob': 'B',
+    'counts': 'Q',
+    'delete_hashes': 'Q',
+    'posting_offsets': 'I',
+    'postings': 'I',
+}
+
+
+def delete_hash(text):
+    # 64-битный стабильный хеш (встроенный hash() меняется между процессами)
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def default_compact_path(dict_path, max_dictionary_edit_distance, prefix_length):
+    return default_index_path(dict_path, max_dictionary_edit_distance, prefix_length) + '.compact'
+
+
+def write_compact_index(sym_spell, index_path, header):
+    # слова хранятся отсортированными (для бинарного поиска), а списки в deletes
+    # сохраняют исходный порядок слов - от него зависит выбор среди равных кандидатов
+    words = sorted(sym_spell.words)
+    word_ids = {word: i for i, word in enumerate(words)}
+
+    blob = bytearray()
+    word_offsets = [0]
+    for word in words:
+        blob += word.encode('utf-8')
+        word_offsets.append(len(blob))
+
+    buckets = {}
+    for delete, suggestions in sym_spell.deletes.items():
+        buckets.setdefault(delete_hash(delete), []).extend(word_ids[s] for s in suggestions)
+
+    delete_hashes = sorted(buckets)
+    posting_offsets = [0]
+    postings = []
+    for value in delete_hashes:
+        postings.extend(buckets[value])
+        posting_offsets.append(len(postings))
+
+    data = {
+        'word_offsets': word_offsets,
+        'word_blob': blob,
+        'counts': [sym_spell.words[word] for word in words],
+        'delete_hashes': delete_hashes,
+        'posting_offsets': posting_offsets,
+        'postings': postings,
+    }
+
+    meta = dict(header)
+    meta['compact_version'] = COMPACT_VERSION
+    meta['byteorder'] = sys.byteorder
+    meta['max_length'] = max((len(word) for word in words), default=0)
+    meta['sections'] = {name: len(data[name]) for name in SECTIONS}
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(meta_bytes)))
+        f.write(meta_bytes)
+        for name in SECTIONS:
+            # секции выровнены по 8 байт, чтобы их можно было читать прямо из mmap
+            f.write(b'\0' * (-f.tell() % 8))
+            values = data[name]
+            if name == 'word_blob':
+                f.write(values)
+            else:
+                f.write(array.array(SECTION_FORMATS[name], values).tobytes())
+    os.replace(temp_path, index_path)
+
+
+class _SortedWords:
+    # последовательность слов поверх mmap для bisect
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+
+class CompactWords:
+    # словарь слово -> частота только для чтения, как SymSpell.words
+    def __init__(self, offsets, blob, counts):
+        self._words = _SortedWords(offsets, blob)
+        self._counts = counts
+
+    def index(self, word):
+        i = bisect.bisect_left(self._words, word)
+        if i < len(self._words) and self._words[i] == word:
+            return i
+        return -1
+
+    def term(self, i):
+        return self._words[i]
+
+    def count(self, i):
+        return self._counts[i]
+
+    def __len__(self):
+        return len(self._words)
+
+    def __contains__(self, word):
+        return self.index(word) >= 0
+
+    def __getitem__(self, word):
+        i = self.index(word)
+        if i < 0:
+            raise KeyError(word)
+        return self._counts[i]
+
+    def get(self, word, default=None):
+        i = self.index(word)
+        return self._counts[i] if i >= 0 else default
+
+
+class CompactSpellIndex:
+    # индекс SymSpell в одном файле, открытый через mmap: процессы-обработчики
+    # разделяют одни и те же страницы памяти только для чтения
+    def __init__(self, index_path):
+        self._file = open(index_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+
+        if view[:4] != MAGIC:
+            self.close()
+            raise ValueError(f"{index_path} не является компактным индексом")
+        meta_len = struct.unpack('<I', view[4:8])[0]
+        self.meta = json.loads(str(view[8:8 + meta_len], 'utf-8'))
+        if self.meta['byteorder'] != sys.byteorder:
+            self.close()
+            raise ValueError(f"{index_path} построен на платформе с другим порядком байтов")
+
+        sections = {}
+        offset = 8 + meta_len
+        for name in SECTIONS:
+            offset += -offset % 8
+            item_format = SECTION_FORMATS[name]
+            size = self.meta['sections'][name] * struct.calcsize(item_format)
+            sections[name] = view[offset:offset + size].cast(item_format)
+            offset += size
+        self._sections = sections
+
+        self._max_dictionary_edit_distance = self.meta['max_dictionary_edit_distance']
+        self._prefix_length = self.meta['prefix_length']
+        self._max_length = self.meta['max_length']
+        self._delete_hashes = sections['delete_hashes']
+        self._posting_offsets = sections['posting_offsets']
+        self._postings = sections['postings']
+        self.words = CompactWords(sections['word_offsets'], sections['word_blob'], sections['counts'])
+
+    def close(self):
+        for section in getattr(self, '_sections', {}).values():
+            section.release()
+        self._sections = {}
+        self.words = None
+        self._delete_hashes = self._posting_offsets = self._postings = None
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        self._mmap.close()
+        self._file.close()
+
+    def _suggestions(self, delete):
+        value = delete_hash(delete)
+        i = bisect.bisect_left(self._delete_hashes, value)
+        if i == len(self._delete_hashes) or self._delete_hashes[i] != value:
+            return ()
+        return self._postings[self._posting_offsets[i]:self._posting_offsets[i + 1]]
+
+    def lookup(self, phrase, verbosity, max_edit_distance=None):
+        # тот же алгоритм, что SymSpell.lookup из symspellpy
+        if max_edit_distance is None:
+            max_edit_distance = self._max_dictionary_edit_distance
+        if max_edit_distance > self._max_dictionary_edit_distance:
+            raise ValueError("distance too large")
+
+        words = self.words
+        suggestions = []
+        phrase_len = len(phrase)
+
+        if phrase_len - max_edit_distance > self._max_length:
+            return suggestions
+
+        phrase_id = words.index(phrase)
+        if phrase_id >= 0:
+            suggestions.append(SuggestItem(phrase, 0, words.count(phrase_id)))
+            if verbosity != Verbosity.ALL:
+                return suggestions
+
+        if max_edit_distance == 0:
+            return suggestions
+
+        considered_deletes = set()
+        considered_suggestions = {phrase_id}
+        max_edit_distance_2 = max_edit_distance
+        prefix_length = self._prefix_length
+
+        phrase_prefix_len = min(phrase_len, prefix_length)
+        candidates = [phrase[:phrase_prefix_len]]
+        candidate_pointer = 0
+
+        while candidate_pointer < len(candidates):
+            candidate = candidates[candidate_pointer]
+            candidate_pointer += 1
+            candidate_len = len(candidate)
+            len_diff = phrase_prefix_len - candidate_len
+
+            if len_diff > max_edit_distance_2:
+                if verbosity == Verbosity.ALL:
+                    continue
+                break
+
+            for suggestion_id in self._suggestions(candidate):
+                if suggestion_id == phrase_id:
+                    continue
+                suggestion = words.term(suggestion_id)
+                suggestion_len = len(suggestion)
+                if (abs(suggestion_len - phrase_len) > max_edit_distance_2
+                        or suggestion_len < candidate_len
+                        or (suggestion_len == candidate_len and suggestion != candidate)):
+                    continue
+                suggestion_prefix_len = min(suggestion_len, prefix_length)
+                if (suggestion_prefix_len > phrase_prefix_len
+                        and suggestion_prefix_len - candidate_len > max_edit_distance_2):
+                    continue
+
+                if candidate_len == 0:
+                    distance = max(phrase_len, suggestion_len)
+                    if distance > max_edit_distance_2 or suggestion_id in considered_suggestions:
+                        continue
+                elif suggestion_len == 1:
+                    distance = phrase_len if suggestion[0] not in phrase else phrase_len - 1
+                    if distance > max_edit_distance_2 or suggestion_id in considered_suggestions:
+                        continue
+                else:
+                    # правки в префиксе уже исчерпали max_edit_distance, а суффиксы различаются
+                    if prefix_length - max_edit_distance == candidate_len:
+                        min_distance = min(phrase_len, suggestion_len) - prefix_length
+                    else:
+                        min_distance = 0
+                    if (prefix_length - max_edit_distance == candidate_len
+                            and (min_distance > 1
+                                 and phrase[phrase_len + 1 - min_distance:]
+                                 != suggestion[suggestion_len + 1 - min_distance:])
+                            or (min_distance > 0
+                                and phrase[phrase_len - min_distance]
+                                != suggestion[suggestion_len - min_distance]
+                                and (phrase[phrase_len - min_distance - 1]
+                                     != suggestion[suggestion_len - min_distance]
+                                     or phrase[phrase_len - min_distance]
+                                     != suggestion[suggestion_len - min_distance - 1]))):
+                        continue
+                    if suggestion_id in considered_suggestions:
+                        continue
+                    considered_suggestions.add(suggestion_id)
+                    distance = damerau_osa(phrase, suggestion, max_edit_distance_2)
+                    if distance > max_edit_distance_2:
+                        continue
+
+                suggestion_count = words.count(suggestion_id)
+                item = SuggestItem(suggestion, distance, suggestion_count)
+                if suggestions:
+                    if verbosity == Verbosity.CLOSEST:
+                        if distance < max_edit_distance_2:
+                            suggestions = []
+                    elif verbosity == Verbosity.TOP:
+                        if distance < max_edit_distance_2 or suggestion_count > suggestions[0].count:
+                            max_edit_distance_2 = distance
+                            suggestions[0] = item
+                        continue
+                if verbosity != Verbosity.ALL:
+                    max_edit_distance_2 = distance
+                suggestions.append(item)
+
+            if len_diff < max_edit_distance and candidate_len <= prefix_length:
+                if verbosity != Verbosity.ALL and len_diff >= max_edit_distance_2:
+                    continue
+                for i in range(candidate_len):
+                    delete = candidate[:i] + candidate[i + 1:]
+                    if delete not in considered_deletes:
+                        considered_deletes.add(delete)
+                        candidates.append(delete)
+
+        if len(suggestions) > 1:
+            suggestions.sort()
+
+        return suggestions
+
+
+def load_compact_index(index_path, header):
+    if not os.path.exists(index_path):
+        return None
+
+    try:
+        index = CompactSpellIndex(index_path)
+    except (ValueError, KeyError, struct.error):
+        return None
+
+    if any(index.meta.get(key) != value for key, value in header.items()) \
+            or index.meta.get('compact_version') != COMPACT_VERSION:
+        index.close()
+        return None
+
+    return index
+
+
+def load_or_build_compact_index(dict_path, max_dictionary_edit_distance=2, prefix_length=7,
+                                word_list=False, index_path=None):
+    if index_path is None:
+        index_path = default_compact_path(dict_path, max_dictionary_edit_distance, prefix_length)
+
+    header = index_header(dict_path, max_dictionary_edit_distance, prefix_length, word_list)
+    index = load_compact_index(index_path, header)
+
+    if index is None:
+        sym_spell = load_or_build_symspell(dict_path, max_dictionary_edit_distance, prefix_length, word_list)
+        print(f"Построение компактного индекса для {dict_path}...")
+        write_compact_index(sym_spell, index_path, header)
+        print(f"Компактный индекс сохранен в {index_path}")
+        index = CompactSpellIndex(index_path)
+
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Построение компактного индекса SymSpell для mmap.')
+    parser.add_argument('--dictionary', required=True, help='Файл словаря')
+    parser.add_argument('--max-edit-distance', type=int, default=2, help='Максимальное расстояние')
+    parser.add_argument('--prefix-length', type=int, default=7, help='Длина префикса')
+    parser.add_argument('--word-list', action='store_true', help='Словарь без частот, одно слово в строке')
+    parser.add_argument('--output', default=None, help='Файл индекса')
+
+    args = parser.parse_args()
+
+    load_or_build_compact_index(args.dictionary, args.max_edit_distance, args.prefix_length,
+                                args.word_list, args.output).close()
@@ -0,0 +1,117 @@
+import os
+import pickle
+from collections import OrderedDict
+
+from symspellpy import Verbosity
+
+CACHE_VERSION = 1
+
+
+class CorrectionCache:
+    # LRU-кеш исправлений слов поверх sym_spell.lookup, общий для всех документов.
+    # version - версия словаря/индекса: кеш с другой версией с диска не загружается
+    def __init__(self, sym_spell, maxsize=100000, path=None, version=None):
+        self.sym_spell = sym_spell
+        self.maxsize = maxsize
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # новые записи копятся, только если кеш работает в процессе-обработчике
+        self.track_updates = False
+        self._updates = []
+        self._reported_hits = 0
+        self._reported_misses = 0
+
+        if path:
+            self.load(path)
+
+    def correct(self, word, verbosity=Verbosity.TOP, max_edit_distance=2):
+        key = (word, max_edit_distance, verbosity.value)
+        entries = self._entries
+
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return entries[key]
+
+        self.misses += 1
+        suggestions = self.sym_spell.lookup(word, verbosity, max_edit_distance=max_edit_distance)
+        corrected = suggestions[0].term if suggestions else word
+
+        entries[key] = corrected
+        if self.track_updates:
+            self._updates.append((key, corrected))
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+        return corrected
+
+    def take_updates(self):
+        # новые записи и счетчики с прошлого вызова: так кеш процесса-обработчика
+        # переносится в кеш главного процесса через apply_updates
+        updates = {
+            'entries': self._updates,
+            'hits': self.hits - self._reported_hits,
+            'misses': self.misses - self._reported_misses,
+        }
+        self._updates = []
+        self._reported_hits = self.hits
+        self._reported_misses = self.misses
+        return updates
+
+    def apply_updates(self, updates):
+        entries = self._entries
+        for key, corrected in updates['entries']:
+            entries[key] = corrected
+            entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        self.hits += updates['hits']
+        self.misses += updates['misses']
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return False
+
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError):
+            return False
+
+        if data.get('cache_version') != CACHE_VERSION or data.get('version') != self.version:
+            return False
+
+        # самые свежие записи в конце; при переполнении остаются они
+        entries = data['entries'][-self.maxsize:] if self.maxsize else []
+        self._entries = OrderedDict(entries)
+        return True
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+
+        data = {
+            'cache_version': CACHE_VERSION,
+            'version': self.version,
+            'entries': list(self._entries.items()),
+        }
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
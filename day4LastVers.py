@@ -1,180 +1,631 @@
+import argparse
 import json
 import os
-from symspellpy import SymSpell, Verbosity
-from ultralytics import YOLO
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
+from itertools import chain, repeat
+
+import numpy as np
+from symspellpy import Verbosity
 from tqdm import tqdm
+
+from archive_sources import (is_member_path, is_tar_archive, iter_source_contents, list_sources, open_text,
+                             read_source, source_basename)
+from correction_cache import CorrectionCache
+from file_utils import file_sha256
+from instrumentation import PROFILE_KINDS, Instrumentation, profiling, start_deferred_profiling
+from result_cache import ResultCache, pair_key
+from results_store import ResultsStore, write_legacy
+from spell_index import load_or_build_symspell
+from webres_stream import iter_text_boxes
 # import day5 для полного пайплайна
 
-webres_dir = "school"
-images_dir = "photoDay4"
+webres_dir = "school"  # папка или архив (.zip, .tar, .tar.gz)
+images_dir = "photoDay4"  # папка или архив
 output_file = "results.txt"
+dictionary_file = "ru_full.txt"
+model_file = "best.pt"
+results_db = "results.sqlite"
 grades_dir = "classJS"
+correction_cache_file = "corrections.cache"
+result_cache_file = "results.cache.json"
+# версия результата конвейера: увеличивается при любом изменении разбора, исправления или
+# сопоставления, меняющем results.txt, - иначе кеш пар отдавал бы старые тексты
+PIPELINE_VERSION = 2
+yolo_batch_size = 8  # изображений за один вызов YOLO на CPU
+decode_workers = 4  # потоков для чтения и декодирования изображений
+parse_workers = os.cpu_count() or 1  # процессов для разбора webRes и исправления текста
 
+# русские слова, в том числе через дефис ("кто-то"). Слово начинается с буквы и не продолжает
+# токен с цифрами или латиницей: в "2-й", "fs-слово", "fs24", "2х2" ничего не совпадает
+WORD_PATTERN = re.compile(r'(?<![\w-])[а-яё]+(?:-[а-яё]+)*(?!\w)', flags=re.IGNORECASE)
 
-sym_spell = SymSpell(max_dictionary_edit_distance=3, prefix_length=7)
-sym_spell.load_dictionary('ru_full.txt', term_index=0, count_index=1, encoding='utf-8')
-model = YOLO('best.pt')
 
+# словарь, кеш исправлений и YOLO создаются при первом обращении: импорт модуля и подкоманды,
+# которым они не нужны (pairs, match), не платят за индекс SymSpell и загрузку torch
+resources = {}
+resources_lock = threading.RLock()
 
-def correct_text(text):
-    suggestions = sym_spell.lookup(text, Verbosity.CLOSEST, max_edit_distance=2)
-    return suggestions[0].term if suggestions else text
 
+def get_resource(name, factory):
+    resource = resources.get(name)
+    if resource is None:
+        with resources_lock:
+            resource = resources.get(name)
+            if resource is None:
+                resource = resources[name] = factory()
+    return resource
 
-def extract_text_from_webres(webres_path):
-    with open(webres_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
 
-    text_boxes = []
+def get_sym_spell():
+    return get_resource('sym_spell', lambda: load_or_build_symspell(
+        dictionary_file, max_dictionary_edit_distance=3, prefix_length=7))
+
+
+def get_correction_cache():
+    return get_resource('correction_cache', lambda: CorrectionCache(
+        get_sym_spell(), path=correction_cache_file, version=file_sha256(dictionary_file)))
+
+
+def load_model():
+    from ultralytics import YOLO  # тянет за собой torch
+    return YOLO(model_file)
+
+
+def get_model():
+    return get_resource('model', load_model)
+
+
+def get_decode_pool():
+    # один пул потоков декодирования на процесс, общий для всех пачек детекции
+    return get_resource('decode_pool', lambda: ThreadPoolExecutor(max_workers=decode_workers))
+
+
+# таймеры этапов и счетчики; включаются флагом --report, иначе ничего не записывают
+instruments = Instrumentation()
 
-    def parse_element(element):
-        if isinstance(element, dict):
-            if 'languages' in element:
-                for lang in element['languages']:
-                    if lang.get('lang') == 'rus':
-                        for text_item in lang.get('texts', []):
-                            text = text_item.get('text', '').strip()
-                            if text:
-                                corrected = correct_text(text)
-                                box = {
-                                    'x': element.get('x', 0),
-                                    'y': element.get('y', 0),
-                                    'w': element.get('w', 0),
-                                    'h': element.get('h', 0),
-                                    'text': corrected
-                                }
-                                text_boxes.append(box)
-            for value in element.values():
-                parse_element(value)
-        elif isinstance(element, list):
-            for item in element:
-                parse_element(item)
-
-    parse_element(data)
 
+def restore_case(original, corrected):
+    if original.isupper() and len(original) > 1:
+        return corrected.upper()
+    if original[0].isupper():
+        return corrected[:1].upper() + corrected[1:]
+    return corrected
+
+
+def correct_text(text):
+    # исправляются только слова вне словаря, каждое уникальное слово строки - один раз
+    sym_spell = get_sym_spell()
+    correction_cache = get_correction_cache()
+    corrections = {}
+    for match in WORD_PATTERN.finditer(text):
+        word = match.group().lower()
+        if word not in corrections:
+            corrections[word] = word if word in sym_spell.words else None
+
+    lookups = 0
+    for word, corrected in corrections.items():
+        if corrected is None:
+            corrections[word] = correction_cache.correct(word, Verbosity.CLOSEST, max_edit_distance=2)
+            lookups += 1
+
+    if instruments.enabled:
+        instruments.count('unique_words', len(corrections))
+        instruments.count('lookups', lookups)
+        instruments.observe('lookups_per_box', lookups)
+
+    return WORD_PATTERN.sub(
+        lambda match: restore_case(match.group(), corrections[match.group().lower()]), text)
+
+
+def extract_text_from_webres(webres_path, content=None):
+    # webRes читается потоком, боксы исправляются по мере разбора.
+    # webres_path - файл или член архива; content - уже прочитанные байты члена.
+    # Разбор и исправление - отдельные этапы: время разбора копится между боксами
+    text_boxes = []
+
+    with open_text(webres_path, content) as f:
+        boxes = iter_text_boxes(f, lang='rus')
+        while True:
+            with instruments.stage('parse'):
+                box = next(boxes, None)
+            if box is None:
+                break
+            with instruments.stage('correct'):
+                box['text'] = correct_text(box['text'])
+            text_boxes.append(box)
+
+    instruments.count('webres_files')
+    instruments.count('text_boxes', len(text_boxes))
     return text_boxes
 
 
-def get_yolo_boxes(image_path):
-    results = model(image_path)
+def load_image(image_path, content=None):
+    # BGR, как ожидает ultralytics для numpy-массивов; content - уже прочитанные байты файла
+    import cv2  # нужен только для детекции
+
+    with instruments.stage('decode'):
+        if content is None and not is_member_path(image_path):
+            image = cv2.imread(image_path)
+        else:
+            # член архива и прочитанные байты декодируются из памяти, без временного файла
+            if content is None:
+                content = read_source(image_path)
+            image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Не удалось прочитать изображение {image_path}")
+    return image
+
+
+def prefetch_images(image_paths, depth=2 * yolo_batch_size, contents=None):
+    # изображения декодируются в общем пуле потоков заранее, но не больше depth штук вперед;
+    # contents - байты изображений, если они уже прочитаны
+    executor = get_decode_pool()
+    futures = deque()
+    sources = zip(image_paths, contents if contents is not None else repeat(None))
+
+    for image_path, content in sources:
+        futures.append((image_path, executor.submit(load_image, image_path, content)))
+        if len(futures) >= depth:
+            break
+
+    while futures:
+        image_path, future = futures.popleft()
+        next_source = next(sources, None)
+        if next_source is not None:
+            futures.append((next_source[0], executor.submit(load_image, *next_source)))
+        try:
+            yield image_path, future.result(), None
+        except Exception as e:
+            yield image_path, None, e
+
+
+def result_to_boxes(result, verbose=False):
+    xyxy = result.boxes.xyxy.tolist()
+    classes = result.boxes.cls.tolist()
     yolo_boxes = []
-    image_name = os.path.basename(image_path)
-    print(f"\nРезультаты обработки для {image_name}:")
-
-    for result in results:
-        for box in result.boxes:
-            xyxy = box.xyxy[0].tolist()
-            cls_id = int(box.cls)
-            conf = box.conf.item()
-            print(
-                f"  Класс: {cls_id}, Метка: {model.names[cls_id]}, Conf: {conf:.2f}, BBox: {xyxy}")
-
-            yolo_boxes.append({
-                'x1': xyxy[0],
-                'y1': xyxy[1],
-                'x2': xyxy[2],
-                'y2': xyxy[3],
-                'label': cls_id
-            })
-    print(f"\nРезультат обработки {image_path} записан в файл")
-    return yolo_boxes
 
+    for (x1, y1, x2, y2), cls_id in zip(xyxy, classes):
+        cls_id = int(cls_id)
+        yolo_boxes.append({'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'label': cls_id})
 
-def match_text_to_tasks(webres_boxes, yolo_boxes):
-    task_texts = {}
+    if verbose:
+        names = get_model().names
+        for box, conf in zip(yolo_boxes, result.boxes.conf.tolist()):
+            print(f"  Класс: {box['label']}, Метка: {names[box['label']]}, Conf: {conf:.2f}, "
+                  f"BBox: {[box['x1'], box['y1'], box['x2'], box['y2']]}")
 
-    for yolo_box in yolo_boxes:
-        task_num = yolo_box['label']
-        matched_texts = []
+    return yolo_boxes
 
-        for webres_box in webres_boxes:
-            # находится ли центр текста внутри YOLO-бокса
-            text_center_x = webres_box['x'] + webres_box['w'] / 2
-            text_center_y = webres_box['y'] + webres_box['h'] / 2
 
-            if (yolo_box['x1'] <= text_center_x <= yolo_box['x2'] and
-                    yolo_box['y1'] <= text_center_y <= yolo_box['y2']):
-                matched_texts.append(webres_box['text'])
+def detect_batch(image_paths, batch_size=yolo_batch_size, verbose=False, contents=None):
+    # боксы YOLO для списка изображений: модель получает изображения пачками по batch_size.
+    # Результат - список боксов для каждого изображения или исключение, если изображение
+    # не прочиталось или YOLO упала на его пачке: ошибка пачки не прерывает остальные
+    model = get_model()
+    detections = {}
+    batch_paths, batch_images = [], []
+
+    def run_batch():
+        try:
+            with instruments.stage('detect'):
+                results = model(batch_images, verbose=False)
+            instruments.count('images', len(batch_images))
+            batch_detections = {}
+            for image_path, result in zip(batch_paths, results):
+                if verbose:
+                    print(f"\nРезультаты обработки для {source_basename(image_path)}:")
+                batch_detections[image_path] = result_to_boxes(result, verbose)
+                instruments.count('yolo_boxes', len(batch_detections[image_path]))
+            detections.update(batch_detections)
+        except Exception as e:
+            instruments.count('detect_errors')
+            for image_path in batch_paths:
+                detections[image_path] = e
+        batch_paths.clear()
+        batch_images.clear()
+
+    for image_path, image, error in prefetch_images(image_paths, 2 * batch_size, contents):
+        if error is not None:
+            detections[image_path] = error
+            continue
+        batch_paths.append(image_path)
+        batch_images.append(image)
+        if len(batch_images) >= batch_size:
+            run_batch()
+
+    if batch_images:
+        run_batch()
+
+    return [detections[image_path] for image_path in image_paths]
+
+
+def get_yolo_boxes(image_path, verbose=False):
+    yolo_boxes = detect_batch([image_path], batch_size=1, verbose=verbose)[0]
+    if isinstance(yolo_boxes, Exception):
+        raise yolo_boxes
+    return yolo_boxes
 
-        if matched_texts:
-            task_label = model.names[task_num].split()[-1]
-            task_texts[task_label] = " ".join(matched_texts)
 
-    return task_texts
+def match_text_to_tasks(webres_boxes, yolo_boxes, names):
+    # центр текста должен попасть в YOLO-бокс; при перекрытии боксов текст достается
+    # меньшему по площади. Тексты задания склеиваются в порядке чтения: по y, затем по x.
+    # names - названия классов YOLO по номеру (model.names), последнее слово - номер задания
+    if not webres_boxes or not yolo_boxes:
+        return {}
 
+    texts = np.array([[box['x'], box['y'], box['w'], box['h']] for box in webres_boxes], dtype=float)
+    rects = np.array([[box['x1'], box['y1'], box['x2'], box['y2']] for box in yolo_boxes], dtype=float)
 
-def process_pair(webres_path, image_path):
-    webres_boxes = extract_text_from_webres(webres_path)
-    yolo_boxes = get_yolo_boxes(image_path)
-    return match_text_to_tasks(webres_boxes, yolo_boxes)
+    centers_x = texts[:, 0] + texts[:, 2] / 2
+    centers_y = texts[:, 1] + texts[:, 3] / 2
 
+    # матрица (YOLO-боксы x тексты)
+    inside = ((rects[:, 0, None] <= centers_x) & (centers_x <= rects[:, 2, None]) &
+              (rects[:, 1, None] <= centers_y) & (centers_y <= rects[:, 3, None]))
+    areas = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+    owners = np.argmin(np.where(inside, areas[:, None], np.inf), axis=0)
+    matched = inside.any(axis=0)
 
-def find_pairs(webres_dir, images_dir):
-    pairs = []
-    webres_files = [f for f in os.listdir(webres_dir) if f.endswith('.webRes')]
+    task_labels = [names[box['label']].split()[-1] for box in yolo_boxes]
+    matched_texts = {label: [] for label in task_labels}
 
-    for webres_file in webres_files:
-        base_name = webres_file.split('__')[0]
-        image_file = f"{base_name}.png"
+    for i in np.lexsort((texts[:, 0], texts[:, 1])):
+        if matched[i]:
+            matched_texts[task_labels[owners[i]]].append(webres_boxes[i]['text'])
 
-        if os.path.exists(os.path.join(images_dir, image_file)):
-            pairs.append((
-                os.path.join(webres_dir, webres_file),
-                os.path.join(images_dir, image_file)
-            ))
+    return {label: " ".join(parts) for label, parts in matched_texts.items() if parts}
 
-    return pairs
 
+def process_pair(webres_path, image_path, yolo_boxes=None):
+    webres_boxes = extract_text_from_webres(webres_path)
+    if yolo_boxes is None:
+        yolo_boxes = get_yolo_boxes(image_path)
+    return match_text_to_tasks(webres_boxes, yolo_boxes, get_model().names)
 
-def main(webres_dir, images_dir, output_file):
-    print('===== НАЧАЛО ОБРАБОТКИ =====')
-    pairs = find_pairs(webres_dir, images_dir)
-    grouped_results = {}
 
-    if not pairs:
-        print("Не найдено пар для обработки")
-        return
+def pair_image_name(webres_file):
+    # изображение к webRes: часть имени до "__" с расширением .png
+    return f"{webres_file.split('__')[0]}.png"
 
 
-    # для прогресс-бара
-    with tqdm(total=len(pairs), desc="Обработка файлов", unit="pair") as pbar:
-        for webres_path, image_path in pairs:
-            image_name = os.path.basename(image_path)
-            base_name = os.path.splitext(image_name)[0]
+def find_pairs(webres_dir, images_dir):
+    # только имена пар (подкоманда pairs); webres_dir и images_dir - папки или архивы,
+    # оглавление каждого читается один раз
+    images = {}
+    for image_path in list_sources(images_dir, '.png'):
+        images.setdefault(source_basename(image_path), image_path)
 
-            pbar.set_description(f"Обработка: {image_name}")
+    pairs = []
+    for webres_path in list_sources(webres_dir, '.webRes'):
+        image_path = images.get(pair_image_name(source_basename(webres_path)))
+        if image_path is not None:
+            pairs.append((webres_path, image_path))
 
-            try:
-                task_texts = process_pair(webres_path, image_path)
+    return pairs
 
-                if base_name not in grouped_results:
-                    grouped_results[base_name] = {}
 
-                for task_label, text in task_texts.items():
-                    if task_label in grouped_results[base_name]:
-                        grouped_results[base_name][task_label] += " " + text
-                    else:
-                        grouped_results[base_name][task_label] = text
+def iter_pairs(webres_dir, images_dir):
+    # (webRes, изображение, байты webRes, байты изображения) по тому же правилу имен, что find_pairs.
+    # Папка и zip читаются по имени, когда нужен файл; одним проходом читается только tar,
+    # а пары к его файлам ищутся по оглавлению другого источника
+    webres_streamed, images_streamed = is_tar_archive(webres_dir), is_tar_archive(images_dir)
+    if webres_streamed and images_streamed:
+        yield from iter_streamed_pairs(webres_dir, images_dir)
+        return
 
-                tasks_found = list(task_texts.keys())
-                pbar.write(f"Сопоставлено: {image_name} | Задания: {', '.join(tasks_found)}")
+    if images_streamed:
+        # изображения без webRes пропускаются, не задерживаясь в памяти
+        webres_by_image = {}
+        for webres_path in list_sources(webres_dir, '.webRes'):
+            webres_by_image.setdefault(pair_image_name(source_basename(webres_path)), []).append(webres_path)
+        for image_path, image_content in iter_source_contents(images_dir, '.png'):
+            # при одинаковых именах, как и в find_pairs, остается первое изображение
+            for webres_path in webres_by_image.pop(source_basename(image_path), ()):
+                yield webres_path, image_path, read_source(webres_path), image_content
+        return
 
-            except Exception as e:
-                pbar.write(f"Ошибка: {image_name} | {str(e)}")
+    images = {}
+    for image_path in list_sources(images_dir, '.png'):
+        images.setdefault(source_basename(image_path), image_path)
+
+    if webres_streamed:
+        webres_members = iter_source_contents(webres_dir, '.webRes')
+    else:
+        webres_members = ((webres_path, None) for webres_path in list_sources(webres_dir, '.webRes'))
+    for webres_path, webres_content in webres_members:
+        image_path = images.get(pair_image_name(source_basename(webres_path)))
+        if image_path is None:
+            continue
+        if webres_content is None:
+            webres_content = read_source(webres_path)
+        yield webres_path, image_path, webres_content, read_source(image_path)
+
+
+def iter_streamed_pairs(webres_dir, images_dir):
+    # оба источника - tar: каждый читается одним проходом в своем порядке (сжатый - без возвратов),
+    # источники - по очереди. Файл без пары ждет ее в памяти, пока другой источник не закончится;
+    # при одинаковом порядке имен в обоих источниках ждущих почти нет
+    webres_members = iter_source_contents(webres_dir, '.webRes')
+    image_members = iter_source_contents(images_dir, '.png')
+    waiting_webres = {}  # имя изображения -> [(webRes, байты)]
+    waiting_images = {}  # имя изображения -> (путь, байты)
+    paired_images = {}  # имя изображения -> путь уже отданного в пару изображения
+    webres_done = images_done = False
+
+    while not (webres_done and images_done):
+        if not webres_done:
+            member = next(webres_members, None)
+            if member is None:
+                webres_done = True
+                waiting_images.clear()
+            else:
+                webres_path, webres_content = member
+                name = pair_image_name(source_basename(webres_path))
+                if name in waiting_images:
+                    image_path, image_content = waiting_images.pop(name)
+                    paired_images[name] = image_path
+                    yield webres_path, image_path, webres_content, image_content
+                elif name in paired_images:
+                    # изображение уже ушло в пару с другим webRes и не хранится - редкий случай,
+                    # когда оно читается из источника еще раз
+                    image_path = paired_images[name]
+                    yield webres_path, image_path, webres_content, read_source(image_path)
+                elif not images_done:
+                    waiting_webres.setdefault(name, []).append(member)
+
+        if not images_done:
+            member = next(image_members, None)
+            if member is None:
+                images_done = True
+                waiting_webres.clear()
+            else:
+                image_path, image_content = member
+                name = source_basename(image_path)
+                # при одинаковых именах, как и в find_pairs, остается первое изображение
+                if name in paired_images or name in waiting_images:
+                    continue
+                if name in waiting_webres:
+                    paired_images[name] = image_path
+                    for webres_path, webres_content in waiting_webres.pop(name):
+                        yield webres_path, image_path, webres_content, image_content
+                elif not webres_done:
+                    waiting_images[name] = member
+
+
+def init_parse_worker(instrumented=False):
+    get_correction_cache().track_updates = True
+    instruments.enabled = instrumented
+
+
+def parse_job(webres_path, content=None):
+    # выполняется в процессе-обработчике; новые исправления и замеры возвращаются в главный процесс
+    webres_boxes = extract_text_from_webres(webres_path, content)
+    return webres_boxes, get_correction_cache().take_updates(), instruments.take()
+
+
+def detection_worker(tasks, done, batch_size):
+    # отдельный поток: собирает из очереди до batch_size изображений и запускает YOLO
+    finished = False
+    while not finished:
+        item = tasks.get()
+        if item is None:
+            break
+        batch = [item]
+        while len(batch) < batch_size:
+            try:
+                item = tasks.get(timeout=0.05)
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            batch.append(item)
+
+        try:
+            detections = detect_batch([image_path for _, image_path, _ in batch], batch_size,
+                                      contents=[content for _, _, content in batch])
+        except Exception as e:
+            detections = [e] * len(batch)
+        for (index, _, _), yolo_boxes in zip(batch, detections):
+            done.put(('detect', index, yolo_boxes))
+
+
+def warm_up_worker():
+    return os.getpid()
+
+
+def run_pipeline(pairs, workers=parse_workers, batch_size=yolo_batch_size):
+    # конвейер: разбор и исправление webRes - в пуле процессов, детекция - в своем потоке
+    # пачками, сопоставление - в главном потоке. pairs - поток (webRes, изображение, байты webRes,
+    # байты изображения); следующая пара берется, только когда в работе меньше max_in_flight
+    # (обратное давление), результаты выдаются в порядке пар
+    max_in_flight = max(workers, batch_size) * 2
+    # словарь загружается до создания процессов: они получают готовый индекс при fork
+    correction_cache = get_correction_cache()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_parse_worker,
+                             initargs=(instruments.enabled,)) as executor:
+        # все процессы запускаются сразу, пока в главном процессе нет других потоков
+        # и не загружены torch/OpenMP: fork процесса с работающими потоками может зависнуть.
+        # YOLO, поток детекции, tqdm (у него свой поток) и выборочный профилировщик появляются только после этого
+        for future in [executor.submit(warm_up_worker) for _ in range(workers)]:
+            future.result()
+        start_deferred_profiling()
+
+        names = get_model().names
+        tasks = queue.Queue(maxsize=max_in_flight)
+        done = queue.Queue()
+        detector = threading.Thread(target=detection_worker, args=(tasks, done, batch_size), daemon=True)
+        detector.start()
+
+        parsed, detected = {}, {}
+        paths, submit_times = {}, {}
+        submitted = next_index = 0
+        pairs = iter(pairs)
+        exhausted = False
+
+        # число пар заранее неизвестно: сжатый tar не читается ради оглавления
+        bars = {
+            'parse': tqdm(desc="Разбор и исправление", unit="pair", position=0),
+            'detect': tqdm(desc="Детекция", unit="pair", position=1),
+            'match': tqdm(desc="Сопоставление", unit="pair", position=2),
+        }
+
+        try:
+            while True:
+                while not exhausted and submitted - next_index < max_in_flight:
+                    pair = next(pairs, None)
+                    if pair is None:
+                        exhausted = True
+                        break
+                    webres_path, image_path, webres_content, image_content = pair
+                    paths[submitted] = (webres_path, image_path)
+                    submit_times[submitted] = time.perf_counter()
+                    # процессу и потоку детекции уходят уже прочитанные байты, а не пути
+                    future = executor.submit(parse_job, webres_path, webres_content)
+                    future.add_done_callback(lambda f, i=submitted: done.put(('parse', i, f)))
+                    tasks.put((submitted, image_path, image_content))
+                    submitted += 1
+
+                if exhausted and next_index == submitted:
+                    break
+
+                stage, index, value = done.get()
+                if stage == 'parse':
+                    parsed[index] = value
+                else:
+                    detected[index] = value
+                bars[stage].update(1)
+
+                while next_index in parsed and next_index in detected:
+                    webres_path, image_path = paths.pop(next_index)
+                    parse_future = parsed.pop(next_index)
+                    yolo_boxes = detected.pop(next_index)
+                    task_texts, error = None, None
+                    try:
+                        webres_boxes, updates, measurements = parse_future.result()
+                        correction_cache.apply_updates(updates)
+                        instruments.merge(measurements)
+                        if isinstance(yolo_boxes, Exception):
+                            raise yolo_boxes
+                        with instruments.stage('match'):
+                            task_texts = match_text_to_tasks(webres_boxes, yolo_boxes, names)
+                    except Exception as e:
+                        error = e
+                        instruments.count('errors')
+                    # от постановки в работу до готового сопоставления
+                    instruments.observe('pair_latency', time.perf_counter() - submit_times.pop(next_index))
+                    bars['match'].update(1)
+                    next_index += 1
+                    yield webres_path, image_path, task_texts, error
+        finally:
+            tasks.put(None)
+            for bar in bars.values():
+                bar.close()
+
+
+def main(webres_dir, images_dir, output_file, report_file=None, quiet=False):
+    print('===== НАЧАЛО ОБРАБОТКИ =====')
+    grouped_results = {}
 
-            pbar.update(1)
+    # пары с неизменными webRes, изображением, моделью и словарем берутся из кеша.
+    # Источники читаются один раз: ключ считается по тем же байтам, что уходят в конвейер
+    result_cache = ResultCache(result_cache_file, {
+        'pipeline': PIPELINE_VERSION,
+        'model': file_sha256(model_file),
+        'dictionary': file_sha256(dictionary_file),
+    })
+    pairs = []  # (изображение, ключ, взята ли из кеша) всех пар в порядке чтения
+    pending_keys = deque()
+
+    def iter_pending():
+        for webres_path, image_path, webres_content, image_content in iter_pairs(webres_dir, images_dir):
+            key = pair_key(webres_content, image_content)
+            cached = key in result_cache
+            pairs.append((image_path, key, cached))
+            if not cached:
+                pending_keys.append(key)
+                yield webres_path, image_path, webres_content, image_content
+
+    pending = iter_pending()
+    first = next(pending, None)
+    # если все пары в кеше, словарь, модель и процессы не нужны
+    if first is None:
+        start_deferred_profiling()
+    else:
+        processed = run_pipeline(chain([first], pending))
+        for webres_path, image_path, task_texts, error in processed:
+            image_name = source_basename(image_path)
+            key = pending_keys.popleft()
+
+            if error is not None:
+                tqdm.write(f"Ошибка: {image_name} | {str(error)}")
+                continue
+
+            result_cache.put(key, task_texts)
+            if not quiet:
+                tasks_found = list(task_texts.keys())
+                tqdm.write(f"Сопоставлено: {image_name} | Задания: {', '.join(tasks_found)}")
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for base_name in sorted(grouped_results.keys()):
-            f.write(f"{base_name}\n")
+        processed.close()
 
-            tasks = grouped_results[base_name]
-            for task_label in sorted(tasks.keys(), key=lambda x: int(x)):
-                f.write(f"Задание {task_label}: \"{tasks[task_label]}\"\n")
+    result_cache.keep_only(key for _, key, _ in pairs)
+    result_cache.save()
 
-            f.write("\n")
+    if not pairs:
+        print("Не найдено пар для обработки")
+        return
 
-    print(f"\nРезультаты сохранены в: {output_file}")
+    cached_count = sum(1 for _, _, cached in pairs if cached)
+    print(f"Из кеша: {cached_count}, обработано: {len(pairs) - cached_count}")
+
+    for image_path, key, _ in pairs:
+        task_texts = result_cache.get(key)
+        if task_texts is None:
+            continue
+
+        base_name = os.path.splitext(source_basename(image_path))[0]
+        if base_name not in grouped_results:
+            grouped_results[base_name] = {}
+
+        for task_label, text in task_texts.items():
+            if task_label in grouped_results[base_name]:
+                grouped_results[base_name][task_label] += " " + text
+            else:
+                grouped_results[base_name][task_label] = text
+
+    write_legacy(grouped_results, output_file)
+    with ResultsStore(results_db) as store:
+        store.write(grouped_results)
+
+    # если все пары взяты из кеша, словарь не загружался
+    stats = None
+    if 'correction_cache' in resources:
+        correction_cache = get_correction_cache()
+        correction_cache.save()
+        stats = correction_cache.stats()
+        print(f"\nКеш исправлений: попаданий {stats['hits']}, промахов {stats['misses']}, "
+              f"доля попаданий {stats['hit_rate']:.1%}")
+
+    print(f"\nРезультаты сохранены в: {output_file} и {results_db}")
+
+    if report_file:
+        instruments.save_report(report_file, meta={
+            'pairs': len(pairs),
+            'cached': cached_count,
+            'processed': len(pairs) - cached_count,
+            'parse_workers': parse_workers,
+            'yolo_batch_size': yolo_batch_size,
+            'correction_cache': stats,
+        })
+        print(f"Отчет о замерах сохранен в: {report_file}")
     print("===== ОБРАБОТКА ЗАВЕРШЕНА =====")
 
     # Запуск модуля оценки для полного пайплайна
@@ -182,6 +633,140 @@ def main(webres_dir, images_dir, output_file):
     # day5.evaluate_works(output_file, grades_dir)
 
 
-if __name__ == "__main__":
-    main(webres_dir, images_dir, output_file)
+def write_jsonl(out, records):
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def command_pairs(args, out):
+    pairs = find_pairs(args.webres_dir, args.images_dir)
+    write_jsonl(out, ({'webres': webres_path, 'image': image_path} for webres_path, image_path in pairs))
+    print(f"Найдено пар: {len(pairs)}")
+
+
+def command_parse(args, out):
+    # нужен только словарь SymSpell
+    for webres_path in args.webres:
+        try:
+            webres_boxes = extract_text_from_webres(webres_path)
+        except Exception as e:
+            print(f"Ошибка: {source_basename(webres_path)} | {e}")
+            continue
+        write_jsonl(out, [{'webres': webres_path, 'boxes': webres_boxes}])
+    if 'correction_cache' in resources:
+        get_correction_cache().save()
+
+
+def command_detect(args, out):
+    # нужна только модель YOLO; название класса пишется в бокс, чтобы match обходился без модели
+    names = get_model().names
+    for image_path, yolo_boxes in zip(args.images, detect_batch(args.images, args.batch_size)):
+        if isinstance(yolo_boxes, Exception):
+            print(f"Ошибка: {source_basename(image_path)} | {yolo_boxes}")
+            continue
+        for box in yolo_boxes:
+            box['name'] = names[box['label']]
+        write_jsonl(out, [{'image': image_path, 'boxes': yolo_boxes}])
+
+
+def command_match(args, out):
+    # вывод parse и detect сводится по правилу имен find_pairs; ни словарь, ни модель не нужны
+    detections = {source_basename(record['image']): record for record in read_jsonl(args.detected)}
+    for record in read_jsonl(args.parsed):
+        detected = detections.get(pair_image_name(source_basename(record['webres'])))
+        if detected is None:
+            print(f"Нет детекции для {record['webres']}")
+            continue
+        names = {box['label']: box['name'] for box in detected['boxes']}
+        with instruments.stage('match'):
+            task_texts = match_text_to_tasks(record['boxes'], detected['boxes'], names)
+        write_jsonl(out, [{'webres': record['webres'], 'image': detected['image'], 'tasks': task_texts}])
+
+
+def command_run(args, out):
+    main(args.webres_dir, args.images_dir, args.output, report_file=args.report, quiet=args.quiet)
+
+
+def insert_default_command(argv, global_actions, command='run'):
+    # подкоманда по умолчанию ставится перед первым аргументом, который не относится к общим
+    # опциям (global_actions и -h): "--webres-dir X" без подкоманды - то же, что "run --webres-dir X"
+    takes_value = {option for action in global_actions if action.nargs != 0 for option in action.option_strings}
+    flags = {'-h', '--help'} | {option for action in global_actions if action.nargs == 0
+                                for option in action.option_strings}
+    i = 0
+    while i < len(argv):
+        option, separator, _ = argv[i].partition('=')
+        if option in takes_value and not separator:
+            i += 2
+        elif option in takes_value or option in flags:
+            i += 1
+        elif argv[i].startswith('-'):
+            break
+        else:
+            return argv  # подкоманда указана
+    return argv[:i] + [command] + argv[i:]
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Распознавание и сопоставление текстов работ с заданиями.')
+    global_actions = [
+        parser.add_argument('--report', metavar='FILE', help='Записать JSON-отчет с таймерами этапов и счетчиками'),
+        parser.add_argument('--profile', choices=PROFILE_KINDS, help='Профилировать главный процесс'),
+        parser.add_argument('--profile-output', help='Файл профиля (по умолчанию day4.prof или day4.stacks)'),
+        parser.add_argument('--quiet', action='store_true', help='Не печатать строку на каждую пару (для run)'),
+    ]
+    subparsers = parser.add_subparsers(dest='command', title='подкоманды (по умолчанию run)')
+
+    pairs_parser = subparsers.add_parser('pairs', help='Только найти пары webRes и изображений')
+    parse_parser = subparsers.add_parser('parse', help='Разобрать и исправить webRes (нужен словарь)')
+    parse_parser.add_argument('webres', nargs='+', help='Файлы webRes или члены архива (архив::имя)')
+    detect_parser = subparsers.add_parser('detect', help='Найти задания на изображениях (нужна модель YOLO)')
+    detect_parser.add_argument('images', nargs='+', help='Файлы изображений или члены архива (архив::имя)')
+    detect_parser.add_argument('--batch-size', type=int, default=yolo_batch_size, help='Изображений за вызов YOLO')
+    match_parser = subparsers.add_parser('match', help='Сопоставить вывод parse и detect')
+    match_parser.add_argument('parsed', help='JSONL из подкоманды parse')
+    match_parser.add_argument('detected', help='JSONL из подкоманды detect')
+    run_parser = subparsers.add_parser('run', help='Полная обработка с кешем, results.txt и results.sqlite')
+    run_parser.add_argument('--output', default=output_file, help='Файл результатов')
+    # --quiet принимается и до, и после run; SUPPRESS не дает подкоманде затереть значение общего флага
+    run_parser.add_argument('--quiet', action='store_true', default=argparse.SUPPRESS,
+                            help='Не печатать строку на каждую пару')
+
+    for subparser in (pairs_parser, run_parser):
+        subparser.add_argument('--webres-dir', default=webres_dir, help='Папка или архив с webRes')
+        subparser.add_argument('--images-dir', default=images_dir, help='Папка или архив с изображениями')
+    for subparser in (pairs_parser, parse_parser, detect_parser, match_parser):
+        subparser.add_argument('--output', default='-', help='JSONL-файл результата (по умолчанию stdout)')
+
+    args = parser.parse_args(insert_default_command(sys.argv[1:], global_actions))
+
+    commands = {
+        'pairs': command_pairs,
+        'parse': command_parse,
+        'detect': command_detect,
+        'match': command_match,
+        'run': command_run,
+    }
+
+    instruments.enabled = args.report is not None
+    profile_output = args.profile_output or ('day4.prof' if args.profile == 'cprofile' else 'day4.stacks')
+    # у run поток выборочного профилировщика стартует после создания процессов разбора
+    with profiling(args.profile, profile_output, deferred=args.command == 'run'):
+        if args.command == 'run':
+            command_run(args, None)
+        else:
+            # JSONL идет в stdout, сообщения о загрузке и ошибках - в stderr
+            out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+            try:
+                with redirect_stdout(sys.stderr):
+                    commands[args.command](args, out)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            if args.report:
+                instruments.save_report(args.report, meta={'command': args.command})
@@ -1,96 +1,378 @@
 # python day5.py --results results.txt --output class.json
+# python day5.py --serve --port 8000
+# curl -s localhost:8000/grade -d '{"works": {"1019641987": {"22": "текст"}}}'
+# curl -s localhost:8000/stats
 import argparse
 import json
 import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-import joblib
-import numpy as np
+from linear_scorer import LinearTextScorer, is_linear_export
+from results_store import load_works
 
 TASK_RANGE = range(22, 29)
 MODEL_FILE = "classification_model.joblib"
+PREDICT_CHUNK_SIZE = 10000  # текстов на один вызов predict
+SERVE_BATCH_SIZE = 256  # текстов в одной микропачке сервиса
+SERVE_BATCH_WAIT = 0.005  # сек ожидания, пока копится микропачка
+LATENCY_WINDOW = 10000  # последних запросов для перцентилей задержки
 
 
 def parse_results(results_file):
-    works = {}
-    current_base_id = None
+    # results.txt в старом формате или хранилище results.sqlite
+    return load_works(results_file, TASK_RANGE)
 
-    with open(results_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
 
-            if 'Задание' not in line:
-                current_base_id = line.rsplit('_', 1)[0]
+def grade_texts(model, texts):
+    # одна пачка - один вызов predict; если пачка падает, задания оцениваются по одному,
+    # чтобы ошибка касалась только своего задания
+    try:
+        return model.predict(texts).tolist()
+    except Exception:
+        scores = []
+        for text in texts:
+            try:
+                scores.append(model.predict([text]).tolist()[0])
+            except Exception as e:
+                scores.append(e)
+        return scores
+
+
+def load_model(model_file):
+    # папка с manifest.json - массивы модели (train_classifier.py --export), sklearn не нужен;
+    # .zip - набор моделей по заданиям (train_classifier.py --per-task), иначе один Pipeline
+    if os.path.isdir(model_file) and is_linear_export(model_file):
+        return LinearTextScorer(model_file)
+    # joblib и sklearn импортируются только для моделей, которым они нужны
+    if model_file.lower().endswith('.zip'):
+        from task_models import TaskModelBundle
+        return TaskModelBundle(model_file)
+    import joblib
+    return joblib.load(model_file)
+
+
+def grade_items(model, items):
+    # items: [(номер задания, текст)]. Набор моделей оценивает тексты пачками по заданиям,
+    # модель задания загружается при первой встрече с ним
+    if not hasattr(model, 'pipeline'):
+        return grade_texts(model, [text for _, text in items])
+
+    positions = {}
+    for i, (task_num, _) in enumerate(items):
+        positions.setdefault(task_num, []).append(i)
+
+    scores = [None] * len(items)
+    for task_num, indices in positions.items():
+        pipeline = model.pipeline(task_num)
+        if pipeline is None:
+            task_scores = [ValueError(f"нет модели для задания {task_num}")] * len(indices)
+        else:
+            task_scores = grade_texts(pipeline, [items[i][1] for i in indices])
+        for i, score in zip(indices, task_scores):
+            scores[i] = score
+    return scores
 
-                if current_base_id not in works:
-                    works[current_base_id] = {}
-            else:
-                if not current_base_id:
-                    continue
 
-                parts = line.split(':', 1)
-                if len(parts) < 2:
-                    continue
+def work_items(tasks):
+    # (номер задания, текст) работы в порядке TASK_RANGE
+    return [(task_num, tasks[str(task_num)]) for task_num in TASK_RANGE if str(task_num) in tasks]
 
-                task_num = parts[0].replace('Задание', '').strip()
-                text = parts[1].strip().strip('"')
 
-                if task_num.isdigit() and int(task_num) in TASK_RANGE:
-                    if task_num in works[current_base_id]:
-                        works[current_base_id][task_num] += " " + text
-                    else:
-                        works[current_base_id][task_num] = text
+def assign_grades(work_id, tasks, scores):
+    # scores - итератор оценок в порядке work_items
+    work_grades = {}
+    for task_num in TASK_RANGE:
+        task_key = str(task_num)
+        if task_key not in tasks:
+            work_grades[task_key] = "Текст задания не найден"
+            continue
+        score = next(scores)
+        if isinstance(score, Exception):
+            print(f"Ошибка при оценке задания {task_key} работы {work_id}: {str(score)}")
+            score = f"Ошибка оценки: {str(score)}"
+        work_grades[task_key] = score
+    return work_grades
 
-    return works
 
+def iter_work_grades(model, results_data, chunk_size=PREDICT_CHUNK_SIZE):
+    # выдает (work_id, оценки) по мере оценки пачек примерно по chunk_size текстов
+    works = []
+    items = []
 
-def predict_grades(results_file, output_file="classifier.json"):
-    if not os.path.exists(MODEL_FILE):
-        print(f"Ошибка: Модель {MODEL_FILE} не найдена")
+    def flush():
+        scores = iter(grade_items(model, items) if items else [])
+        for work_id, tasks in works:
+            yield work_id, assign_grades(work_id, tasks, scores)
+        works.clear()
+        items.clear()
+
+    for work_id, tasks in results_data.items():
+        works.append((work_id, tasks))
+        items.extend(work_items(tasks))
+        if len(items) >= chunk_size:
+            yield from flush()
+
+    yield from flush()
+
+
+def predict_grades(results_file, output_file="classifier.json", chunk_size=PREDICT_CHUNK_SIZE, jsonl=False,
+                   model_file=MODEL_FILE):
+    if not os.path.exists(model_file):
+        print(f"Ошибка: Модель {model_file} не найдена")
         print("Сначала обучите модель")
         return
 
-    model = joblib.load(MODEL_FILE)
-    print(f"Модель оценки загружена из {MODEL_FILE}")
+    model = load_model(model_file)
+    print(f"Модель оценки загружена из {model_file}")
 
     results_data = parse_results(results_file)
 
-    predicted_grades = {}
+    if jsonl:
+        # JSON Lines: по строке на работу, пишутся сразу после оценки пачки
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for work_id, work_grades in iter_work_grades(model, results_data, chunk_size):
+                f.write(json.dumps({'id': work_id, 'grades': work_grades}, ensure_ascii=False) + "\n")
+    else:
+        predicted_grades = dict(iter_work_grades(model, results_data, chunk_size))
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(predicted_grades, f, ensure_ascii=False, indent=2)
+
+    print(f"\nРезультаты оценки сохранены в {output_file}")
 
-    for work_id, tasks in results_data.items():
-        work_grades = {}
 
-        for task_num in TASK_RANGE:
-            task_key = str(task_num)
-            if task_key in tasks:
-                text = tasks[task_key]
+class MicroBatcher:
+    # собирает тексты параллельных запросов в общие пачки для predict.
+    # Пачка уходит в модель, когда набралось max_batch текстов или прошло max_wait сек
+    def __init__(self, model, max_batch=SERVE_BATCH_SIZE, max_wait=SERVE_BATCH_WAIT):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.jobs = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def grade(self, items):
+        if not items:
+            return []
+        job = {'items': items, 'scores': None, 'done': threading.Event()}
+        self.jobs.put(job)
+        job['done'].wait()
+        return job['scores']
+
+    def _run(self):
+        while True:
+            jobs = [self.jobs.get()]
+            size = len(jobs[0]['items'])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
                 try:
-                    score = model.predict([text])[0]
-                    work_grades[task_key] = score
-                except Exception as e:
-                    print(f"Ошибка при оценке задания {task_key} работы {work_id}: {str(e)}")
-                    work_grades[task_key] = f"Ошибка оценки: {str(e)}"
+                    job = self.jobs.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                size += len(job['items'])
+
+            items = [item for job in jobs for item in job['items']]
+            try:
+                scores = grade_items(self.model, items)
+            except Exception as e:
+                scores = [e] * len(items)
+            self.batches += 1
+            self.texts += len(items)
+
+            pos = 0
+            for job in jobs:
+                job['scores'] = scores[pos:pos + len(job['items'])]
+                pos += len(job['items'])
+                job['done'].set()
+
+
+class LatencyStats:
+    # задержки последних запросов сервиса и перцентили по ним
+    def __init__(self, window=LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def add(self, seconds, error=False):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.errors += error
+
+    def summary(self):
+        with self.lock:
+            values = sorted(self.latencies)
+            summary = {'requests': self.requests, 'errors': self.errors}
+
+        for name, p in (('p50_ms', 50), ('p90_ms', 90), ('p99_ms', 99), ('max_ms', 100)):
+            if values:
+                summary[name] = round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 2)
             else:
-                work_grades[task_key] = "Текст задания не найден"
+                summary[name] = None
+        return summary
 
-            # Преобразуем все numpy int32 в обычные int
-            for task_key, score in work_grades.items():
-                if isinstance(score, np.integer):
-                    work_grades[task_key] = int(score)
 
-            predicted_grades[work_id] = work_grades
+def grade_works(batcher, works):
+    # works: {work_id: {номер задания: текст}} -> {work_id: оценки} как в выходном JSON
+    items = []
+    for tasks in works.values():
+        items.extend(work_items(tasks))
+    scores = iter(batcher.grade(items))
+    return {work_id: assign_grades(work_id, tasks, scores) for work_id, tasks in works.items()}
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(predicted_grades, f, ensure_ascii=False, indent=2)
 
-    print(f"\nРезультаты оценки сохранены в {output_file}")
+def is_valid_works(works):
+    return isinstance(works, dict) and all(
+        isinstance(tasks, dict) and all(isinstance(text, str) for text in tasks.values())
+        for tasks in works.values())
+
+
+class GradingHandler(BaseHTTPRequestHandler):
+    # POST /grade {"works": {"1019641987": {"22": "текст", ...}}} -> {"1019641987": {"22": оценка, ...}}
+    # GET /stats - задержки и микропачки, GET /health - проверка, что сервис жив
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json({'status': 'ok'})
+        elif self.path == '/stats':
+            self.send_json(self.server.stats())
+        else:
+            self.send_json({'error': 'Неизвестный путь'}, 404)
+
+    def do_POST(self):
+        if self.path != '/grade':
+            self.send_json({'error': 'Неизвестный путь'}, 404)
+            return
+
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            works = json.loads(self.rfile.read(length)).get('works')
+        except (ValueError, AttributeError):
+            works = None
+        if not is_valid_works(works):
+            self.server.latency.add(time.perf_counter() - start, error=True)
+            self.send_json({'error': 'Ожидается {"works": {work_id: {номер задания: текст}}}'}, 400)
+            return
+
+        grades = grade_works(self.server.batcher, works)
+        self.server.latency.add(time.perf_counter() - start)
+        self.send_json(grades)
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # задержки собираются в /stats, построчный лог запросов не ведется
+        pass
+
+
+class GradingServer(ThreadingHTTPServer):
+    # очередь соединений больше стандартной: запросы приходят пачками от многих клиентов
+    request_queue_size = 128
+
+    def __init__(self, address, batcher):
+        super().__init__(address, GradingHandler)
+        self.batcher = batcher
+        self.latency = LatencyStats()
+        self.started = time.monotonic()
+
+    def stats(self):
+        batches = self.batcher.batches
+        return {
+            'uptime_s': round(time.monotonic() - self.started, 1),
+            'latency': self.latency.summary(),
+            'batches': batches,
+            'texts': self.batcher.texts,
+            'mean_batch_size': round(self.batcher.texts / batches, 2) if batches else 0.0,
+        }
+
+
+class UnixGradingServer(GradingServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # у Unix-сокета нет хоста и порта, которые ищет HTTPServer.server_bind
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def serve(host='127.0.0.1', port=8000, socket_path=None,
+          max_batch=SERVE_BATCH_SIZE, max_wait=SERVE_BATCH_WAIT, model_file=MODEL_FILE):
+    if not os.path.exists(model_file):
+        print(f"Ошибка: Модель {model_file} не найдена")
+        print("Сначала обучите модель")
+        return
+
+    # модель загружается один раз и живет в памяти все время работы сервиса
+    model = load_model(model_file)
+    print(f"Модель оценки загружена из {model_file}")
+    batcher = MicroBatcher(model, max_batch, max_wait)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixGradingServer(socket_path, batcher)
+        print(f"Сервис оценки слушает {socket_path}")
+    else:
+        server = GradingServer((host, port), batcher)
+        print(f"Сервис оценки слушает http://{host}:{server.server_port}")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # по Ctrl+C и SIGTERM сервис останавливается и печатает статистику
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        print(json.dumps(server.stats(), ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--results', required=True, help='Файл с распознанными текстами')
+    parser.add_argument('--results', help='Файл с распознанными текстами')
     parser.add_argument('--output', default='classifier.json', help='Файл для сохранения оценок')
+    parser.add_argument('--chunk-size', type=int, default=PREDICT_CHUNK_SIZE, help='Текстов на один вызов модели')
+    parser.add_argument('--model', default=MODEL_FILE,
+                        help='Модель оценки: .joblib, набор моделей по заданиям .zip или папка экспорта')
+    parser.add_argument('--jsonl', action='store_true', help='Писать оценки в формате JSON Lines по мере оценки')
+    parser.add_argument('--serve', action='store_true', help='Запустить сервис оценки вместо обработки файла')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес сервиса')
+    parser.add_argument('--port', type=int, default=8000, help='Порт сервиса')
+    parser.add_argument('--socket', help='Слушать Unix-сокет вместо порта')
+    parser.add_argument('--batch-size', type=int, default=SERVE_BATCH_SIZE, help='Текстов в микропачке сервиса')
+    parser.add_argument('--batch-wait', type=float, default=SERVE_BATCH_WAIT * 1000,
+                        help='Сколько мс ждать, пока копится микропачка')
 
     args = parser.parse_args()
-    predict_grades(args.results, args.output)
+    if args.serve:
+        serve(args.host, args.port, args.socket, args.batch_size, args.batch_wait / 1000, args.model)
+    elif args.results:
+        predict_grades(args.results, args.output, args.chunk_size, args.jsonl, args.model)
+    else:
+        parser.error('нужен --results или --serve')
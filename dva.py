@@ -1,34 +1,12 @@
 import json
 import re
 import time
-from collections import defaultdict
 from tqdm import tqdm
 
+from ngram_index import load_or_build_ngram_index
 
-def levenshtein(s1, s2):
-    if s1 == s2:
-        return 0
 
-    len1, len2 = len(s1), len(s2)
-    if len1 > len2:
-        s1, s2 = s2, s1
-        len1, len2 = len2, len1
-
-    current = list(range(len1 + 1))
-    for i in range(1, len2 + 1):
-        previous, current = current, [i] + [0] * len1
-        for j in range(1, len1 + 1):
-            add = previous[j] + 1
-            delete = current[j - 1] + 1
-            change = previous[j - 1]
-            if s1[j - 1] != s2[i - 1]:
-                change += 1
-            current[j] = min(add, delete, change)
-
-    return current[len1]
-
-
-def correct_words(original_words, dictionary_set, length_dict):
+def correct_words(original_words, dictionary_set, index):
     corrected = []
     seen_words = set()  # уже обработаны
 
@@ -43,18 +21,16 @@ def correct_words(original_words, dictionary_set, length_dict):
             corrected.append(lower_word)
             continue
 
-        candidates = []
         target_len = len(lower_word)
-        for length in [target_len - 2, target_len - 1, target_len, target_len + 1, target_len + 2]:
-            if length in length_dict:
-                candidates.extend(length_dict[length])
+        lengths = [target_len - 2, target_len - 1, target_len, target_len + 1, target_len + 2]
+        # индекс триграмм дает то же слово, что перебор словаря этих длин по порядку
+        closest, _ = index.closest(lower_word, lengths)
 
-        if not candidates:
+        if closest is None:
             corrected.append(lower_word)
             continue
 
-        closest = min(candidates, key=lambda w: levenshtein(lower_word, w))
-        corrected.append(closest)
+        corrected.append(closest.lower())
 
     return corrected
 
@@ -78,7 +54,8 @@ def main():
     start_total = time.time()
 
     print("Загрузка словаря...")
-    dict_set, len_dict = load_dictionary('russian.utf-8')
+    dict_set = load_dictionary('russian.utf-8')
+    index = load_or_build_ngram_index('russian.utf-8')
 
     print("Обработка входного файла...")
     with open('input.txt.webRes', 'r', encoding='utf-8') as f:
@@ -88,7 +65,7 @@ def main():
     ordered_words = process_text(text)
     print(f"Найдено уникальных слов: {len(ordered_words)}")
 
-    corrected_words = correct_words(ordered_words, dict_set, len_dict)
+    corrected_words = correct_words(ordered_words, dict_set, index)
 
     with open(output_name, 'w', encoding='utf-8') as f:
         f.write('\n'.join(corrected_words))
@@ -99,14 +76,7 @@ def main():
 
 def load_dictionary(dict_path):
     with open(dict_path, 'r', encoding='utf-8') as f:
-        dictionary = [line.strip().lower() for line in f if line.strip()]
-
-    dict_set = set(dictionary)
-    len_dict = defaultdict(list)
-    for word in dictionary:
-        len_dict[len(word)].append(word)
-
-    return dict_set, len_dict
+        return {line.strip().lower() for line in f if line.strip()}
 
 
 if __name__ == "__main__":
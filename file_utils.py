@@ -0,0 +1,20 @@
+import hashlib
+
+import numpy as np
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pack_strings(strings):
+    # строки одним байтовым массивом через \0: в именах файлов, id и словах словаря его не бывает
+    return np.frombuffer('\0'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+
+def unpack_strings(packed, count):
+    return packed.tobytes().decode('utf-8').split('\0') if count else []
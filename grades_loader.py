@@ -0,0 +1,150 @@
+# python grades_loader.py --grades classJS
+import argparse
+import json
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from file_utils import pack_strings, unpack_strings
+
+GRADES_CACHE_VERSION = 1
+LOAD_WORKERS = 8
+LOAD_CHUNK_SIZE = 256  # файлов на одну задачу потока
+
+ID_PATTERN = re.compile(rb'"id"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+)')
+MASK_PATTERN = re.compile(rb'"mask"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def default_cache_path(grades_dir):
+    # classJS -> classJS.grades.npz рядом с папкой
+    return os.path.normpath(grades_dir) + '.grades.npz'
+
+
+def parse_mask(mask):
+    # "2(2)1(3)0(1)" -> [2, 1, 0]: балл стоит перед скобкой
+    return [int(part.split('(')[0]) for part in mask.split(')')[:-1]]
+
+
+def read_grade_file(filepath):
+    # из файла нужны только id и mask - они ищутся прямо в байтах без разбора всего JSON.
+    # Если поле встречается не один раз (вложенные объекты), файл разбирается целиком
+    with open(filepath, 'rb') as f:
+        data = f.read()
+
+    id_matches = ID_PATTERN.findall(data)
+    mask_matches = MASK_PATTERN.findall(data)
+    if len(id_matches) == 1 and len(mask_matches) == 1:
+        work_id = json.loads(id_matches[0])
+        mask = json.loads(mask_matches[0])
+    else:
+        record = json.loads(data.decode('utf-8'))
+        work_id = record['id']
+        mask = record['mask']
+
+    return work_id, parse_mask(mask)
+
+
+def read_grade_files(filepaths):
+    return [read_grade_file(filepath) for filepath in filepaths]
+
+
+def load_cache(cache_path):
+    # {имя файла: (mtime_ns, размер, work_id, оценки)}
+    try:
+        with np.load(cache_path, allow_pickle=False) as data:
+            if int(data['version']) != GRADES_CACHE_VERSION:
+                return {}
+            mtimes = data['mtimes'].tolist()
+            names = unpack_strings(data['names'], len(mtimes))
+            work_ids = unpack_strings(data['work_ids'], len(mtimes))
+            int_ids = data['int_ids'].tolist()
+            sizes = data['sizes'].tolist()
+            offsets = data['offsets'].tolist()
+            scores = data['scores'].tolist()
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return {}
+
+    return {
+        name: (mtimes[i], sizes[i], int(work_ids[i]) if int_ids[i] else work_ids[i],
+               scores[offsets[i]:offsets[i + 1]])
+        for i, name in enumerate(names)
+    }
+
+
+def save_cache(cache_path, entries):
+    # все оценки одним плоским массивом, offsets - границы работ
+    names = list(entries)
+    offsets = [0]
+    scores = []
+    for name in names:
+        scores.extend(entries[name][3])
+        offsets.append(len(scores))
+
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(
+            f,
+            version=np.array(GRADES_CACHE_VERSION),
+            names=pack_strings(names),
+            mtimes=np.array([entries[name][0] for name in names], dtype=np.int64),
+            sizes=np.array([entries[name][1] for name in names], dtype=np.int64),
+            work_ids=pack_strings([str(entries[name][2]) for name in names]),
+            # id в JSON бывает и числом: при загрузке он должен остаться числом
+            int_ids=np.array([isinstance(entries[name][2], int) for name in names], dtype=bool),
+            offsets=np.array(offsets, dtype=np.int64),
+            scores=np.array(scores, dtype=np.int32),
+        )
+    os.replace(temp_path, cache_path)
+
+
+def load_grade_dir(grades_dir, cache_path=None, workers=LOAD_WORKERS):
+    # {work_id: [оценки]}; заново читаются только новые файлы и файлы с другими mtime или размером
+    cache_path = cache_path or default_cache_path(grades_dir)
+    cached = load_cache(cache_path)
+
+    files = []
+    with os.scandir(grades_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                files.append((entry.name, stat.st_mtime_ns, stat.st_size))
+
+    changed = [name for name, mtime, size in files
+               if name not in cached or cached[name][:2] != (mtime, size)]
+    # файлы раздаются потокам кусками: задача на каждый файл стоит дороже его чтения
+    filepaths = [os.path.join(grades_dir, name) for name in changed]
+    chunks = [filepaths[i:i + LOAD_CHUNK_SIZE] for i in range(0, len(filepaths), LOAD_CHUNK_SIZE)]
+    parsed = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk, records in zip(chunks, executor.map(read_grade_files, chunks)):
+            for filepath, record in zip(chunk, records):
+                parsed[os.path.basename(filepath)] = record
+
+    entries = {}
+    grades = {}
+    for name, mtime, size in files:
+        work_id, scores = parsed[name] if name in parsed else cached[name][2:]
+        entries[name] = (mtime, size, work_id, scores)
+        grades[work_id] = scores
+
+    if changed or len(entries) != len(cached):
+        save_cache(cache_path, entries)
+
+    return grades
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Загрузка оценок из папки JSON-файлов с кешем.')
+    parser.add_argument('--grades', required=True, help='Папка с JSON-файлами оценок')
+    parser.add_argument('--cache', help='Файл кеша (по умолчанию <папка>.grades.npz)')
+    parser.add_argument('--workers', type=int, default=LOAD_WORKERS, help='Потоков чтения файлов')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    grades = load_grade_dir(args.grades, args.cache, args.workers)
+    print(f"Загружены оценки {len(grades)} работ за {time.perf_counter() - start:.2f} с")
@@ -0,0 +1,225 @@
+import cProfile
+import json
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPORT_VERSION = 1
+PROFILE_KINDS = ('cprofile', 'sample')
+SAMPLE_INTERVAL = 0.005
+
+NULL_STAGE = nullcontext()
+
+
+def peak_rss_mb(who=None):
+    # пиковый RSS процесса (или его завершенных дочерних процессов); на Windows модуля resource нет
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def summarize(values):
+    if not len(values):
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        'count': len(ordered),
+        'total': sum(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': ordered[-1],
+    }
+
+
+class Stage:
+    __slots__ = ('instrumentation', 'name', 'start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.observe(self.name, time.perf_counter() - self.start, kind='stages')
+        return False
+
+
+class Instrumentation:
+    # таймеры этапов, счетчики и ряды значений (задержка пары, запросов к словарю на бокс).
+    # Выключенный объект ничего не записывает: stage() отдает пустой контекст, остальное
+    # сразу возвращается, так что вызовы можно оставлять в горячем коде
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.stages = {}
+        self.series = {}
+        self.counters = Counter()
+
+    def stage(self, name):
+        # with instrumentation.stage('detect'): ... - время каждого входа копится под именем этапа
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def observe(self, name, value, kind='series'):
+        if self.enabled:
+            target = self.stages if kind == 'stages' else self.series
+            with self.lock:
+                values = target.get(name)
+                if values is None:
+                    values = target[name] = array('d')
+                values.append(value)
+
+    def take(self):
+        # накопленное с прошлого вызова - для передачи из процесса-обработчика в главный (merge)
+        if not self.enabled:
+            return None
+        with self.lock:
+            snapshot = {'stages': self.stages, 'series': self.series, 'counters': dict(self.counters)}
+            self.stages, self.series, self.counters = {}, {}, Counter()
+        return snapshot
+
+    def merge(self, snapshot):
+        if not self.enabled or not snapshot:
+            return
+        with self.lock:
+            for kind in ('stages', 'series'):
+                target = getattr(self, kind)
+                for name, values in snapshot[kind].items():
+                    target.setdefault(name, array('d')).extend(values)
+            self.counters.update(snapshot['counters'])
+
+    def report(self, meta=None):
+        with self.lock:
+            return {
+                'version': REPORT_VERSION,
+                'wall_time': time.time() - self.started,
+                'peak_rss_mb': {
+                    'main': peak_rss_mb(),
+                    'children': peak_rss_mb(resource.RUSAGE_CHILDREN) if resource is not None else None,
+                },
+                'stages': {name: summarize(values) for name, values in sorted(self.stages.items())},
+                'series': {name: summarize(values) for name, values in sorted(self.series.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'meta': meta or {},
+            }
+
+    def save_report(self, path, meta=None):
+        report = self.report(meta)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+
+class SamplingProfiler:
+    # раз в interval секунд снимает стеки всех потоков процесса (в отличие от cProfile,
+    # который видит только свой поток) и считает одинаковые стеки. Результат - строки
+    # "кадр;кадр;... число" в формате collapsed stacks для flamegraph.pl/speedscope
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+
+    def run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# профилировщики profiling(..., deferred=True), поток которых еще не запущен
+deferred_profilers = []
+
+
+def start_deferred_profiling():
+    # запускает отложенный поток SamplingProfiler - когда процессы-обработчики уже созданы
+    while deferred_profilers:
+        deferred_profilers.pop().start()
+
+
+@contextmanager
+def profiling(kind, path, deferred=False):
+    # kind: None, 'cprofile' (pstats-файл для snakeviz/pstats) или 'sample' (collapsed stacks).
+    # Профилируется только главный процесс; процессы-обработчики не попадают ни в один из режимов.
+    # deferred: поток SamplingProfiler стартует только в start_deferred_profiling(), потому что
+    # fork процесса с работающими потоками может зависнуть; cProfile потоков не создает
+    if kind is None:
+        yield
+        return
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f"Неизвестный профилировщик: {kind}")
+
+    profiler = cProfile.Profile() if kind == 'cprofile' else SamplingProfiler()
+    if kind == 'cprofile':
+        profiler.enable()
+    elif deferred:
+        deferred_profilers.append(profiler)
+    else:
+        profiler.start()
+    try:
+        yield
+    finally:
+        if kind == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(path)
+        else:
+            if profiler in deferred_profilers:
+                # точка запуска так и не наступила
+                deferred_profilers.remove(profiler)
+            else:
+                profiler.stop()
+            profiler.save(path)
+        print(f"Профиль сохранен в {path}")
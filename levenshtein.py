@@ -0,0 +1,153 @@
+def levenshtein(s1, s2, max_distance=None):
+    # max_distance - порог: если расстояние больше порога, возвращается max_distance + 1,
+    # а вычисление прерывается, как только вся строка таблицы превысила порог
+    if s1 == s2:
+        return 0
+
+    len1, len2 = len(s1), len(s2)
+    if len1 > len2:
+        s1, s2 = s2, s1
+        len1, len2 = len2, len1
+
+    if max_distance is None:
+        max_distance = len2
+    too_far = max_distance + 1
+
+    if len2 - len1 > max_distance:
+        return too_far
+
+    # общие префикс и суффикс не влияют на расстояние
+    start = 0
+    while start < len1 and s1[start] == s2[start]:
+        start += 1
+    while start < len1 and s1[len1 - 1] == s2[len2 - 1]:
+        len1 -= 1
+        len2 -= 1
+    s1 = s1[start:len1]
+    s2 = s2[start:len2]
+    len1 -= start
+    len2 -= start
+
+    if len1 == 0:
+        return len2 if len2 <= max_distance else too_far
+
+    # полоса Укконена: клетки с |i - j| > max_distance заведомо больше порога
+    previous = [j if j <= max_distance else too_far for j in range(len1 + 1)]
+    for i in range(1, len2 + 1):
+        current = [too_far] * (len1 + 1)
+        current[0] = i if i <= max_distance else too_far
+        row_min = current[0]
+        char2 = s2[i - 1]
+
+        for j in range(max(1, i - max_distance), min(len1, i + max_distance) + 1):
+            value = previous[j - 1]
+            if s1[j - 1] != char2:
+                value += 1
+            add = previous[j] + 1
+            if add < value:
+                value = add
+            delete = current[j - 1] + 1
+            if delete < value:
+                value = delete
+            if value > too_far:
+                value = too_far
+            current[j] = value
+            if value < row_min:
+                row_min = value
+
+        if row_min > max_distance:
+            return too_far
+        previous = current
+
+    return previous[len1]
+
+
+def closest_word(word, candidates, key=None):
+    # то же, что min(candidates, key=lambda w: levenshtein(word, w)), но с отсечением:
+    # каждый следующий кандидат считается только до лучшего найденного расстояния.
+    # Рабочий поиск (dva.py, odin.py) идет через ngram_index; здесь - полный перебор,
+    # эталон и базовая линия для bench.py
+    best = None
+    best_distance = None
+
+    for candidate in candidates:
+        other = key(candidate) if key else candidate
+
+        if best_distance is None:
+            distance = levenshtein(word, other)
+        else:
+            distance = levenshtein(word, other, best_distance - 1)
+            if distance >= best_distance:
+                continue
+
+        best, best_distance = candidate, distance
+        if best_distance == 0:
+            break
+
+    return best, best_distance
+
+
+def damerau_osa(s1, s2, max_distance=None):
+    # расстояние Дамерау-Левенштейна (optimal string alignment), как в SymSpell:
+    # к операциям Левенштейна добавлена перестановка соседних символов
+    if s1 == s2:
+        return 0
+
+    len1, len2 = len(s1), len(s2)
+    if len1 > len2:
+        s1, s2 = s2, s1
+        len1, len2 = len2, len1
+
+    if max_distance is None:
+        max_distance = len2
+    too_far = max_distance + 1
+
+    if len2 - len1 > max_distance:
+        return too_far
+
+    start = 0
+    while start < len1 and s1[start] == s2[start]:
+        start += 1
+    while start < len1 and s1[len1 - 1] == s2[len2 - 1]:
+        len1 -= 1
+        len2 -= 1
+    s1 = s1[start:len1]
+    s2 = s2[start:len2]
+    len1 -= start
+    len2 -= start
+
+    if len1 == 0:
+        return len2 if len2 <= max_distance else too_far
+
+    before_previous = None
+    previous = [j if j <= max_distance else too_far for j in range(len1 + 1)]
+    for i in range(1, len2 + 1):
+        current = [too_far] * (len1 + 1)
+        current[0] = i if i <= max_distance else too_far
+        row_min = current[0]
+        char2 = s2[i - 1]
+
+        for j in range(max(1, i - max_distance), min(len1, i + max_distance) + 1):
+            value = previous[j - 1]
+            if s1[j - 1] != char2:
+                value += 1
+            add = previous[j] + 1
+            if add < value:
+                value = add
+            delete = current[j - 1] + 1
+            if delete < value:
+                value = delete
+            if (i > 1 and j > 1 and s1[j - 1] == s2[i - 2] and s1[j - 2] == char2
+                    and before_previous[j - 2] + 1 < value):
+                value = before_previous[j - 2] + 1
+            if value > too_far:
+                value = too_far
+            current[j] = value
+            if value < row_min:
+                row_min = value
+
+        if row_min > max_distance:
+            return too_far
+        before_previous, previous = previous, current
+
+    return previous[len1]
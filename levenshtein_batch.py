@@ -0,0 +1,57 @@
+import numpy as np
+
+# batch_levenshtein считает расстояния для NgramIndex. pack_length_dict и closest_word_batch -
+# полный перебор словаря по длинам: рабочий код его больше не вызывает, он остался эталоном
+# и базовой линией для bench.py
+
+
+def pack_length_dict(length_dict):
+    # {длина: список слов} -> {длина: (слова, массив кодов символов формы (n, длина))}
+    packed = {}
+    for length, words in length_dict.items():
+        if not words or length <= 0:
+            continue
+        codes = np.frombuffer(''.join(words).encode('utf-32-le'), dtype=np.uint32)
+        packed[length] = (list(words), codes.reshape(len(words), length))
+
+    return packed
+
+
+def batch_levenshtein(word, codes):
+    # расстояния от word до всех слов одной длины сразу: строки DP считаются
+    # векторно по всем кандидатам, цикл идет только по символам word
+    count, length = codes.shape
+    steps = np.arange(length + 1, dtype=np.int32)
+    previous = np.broadcast_to(steps, (count, length + 1))
+    current = np.empty((count, length + 1), dtype=np.int32)
+
+    for i, char in enumerate(word, 1):
+        change = previous[:, :-1] + (codes != ord(char))
+        add = previous[:, 1:] + 1
+        current[:, 0] = i
+        np.minimum(change, add, out=current[:, 1:])
+        # вставки внутри строки: current[j] = min(current[k] + (j - k)), k <= j
+        np.minimum.accumulate(current - steps, axis=1, out=current)
+        current += steps
+        previous, current = current, np.empty_like(current)
+
+    return previous[:, length].copy()
+
+
+def closest_word_batch(word, packed, lengths):
+    # то же, что min(кандидаты всех длин из lengths по порядку, key=levenshtein)
+    best = None
+    best_distance = None
+
+    for length in lengths:
+        if length not in packed:
+            continue
+        words, codes = packed[length]
+        distances = batch_levenshtein(word, codes)
+        index = int(np.argmin(distances))
+        distance = int(distances[index])
+
+        if best_distance is None or distance < best_distance:
+            best, best_distance = words[index], distance
+
+    return best, best_distance
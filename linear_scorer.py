@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+ARRAYS_VERSION = 2
+MANIFEST = 'manifest.json'
+ARRAY_FILES = {
+    'vocabulary': 'vocabulary.npy',
+    'columns': 'columns.npy',
+    'idf': 'idf.npy',
+    'scale': 'scale.npy',
+    'coef': 'coef.npy',
+    'intercept': 'intercept.npy',
+}
+
+
+def export_linear_model(model, out_dir):
+    # Pipeline TfidfVectorizer -> StandardScaler(with_mean=False) -> линейный классификатор
+    # раскладывается в .npy-массивы и manifest.json; sklearn для оценки по ним не нужен
+    steps = [step for _, step in model.steps]
+    vectorizer, clf = steps[0], steps[-1]
+    scaler = steps[1] if len(steps) == 3 else None
+
+    if (not hasattr(vectorizer, 'vocabulary_') or vectorizer.analyzer != 'word'
+            or vectorizer.tokenizer or vectorizer.preprocessor or vectorizer.stop_words or vectorizer.strip_accents):
+        raise ValueError("Экспорт поддерживает только TfidfVectorizer со стандартным разбором на слова")
+    if scaler is not None and (not hasattr(scaler, 'scale_') or scaler.with_mean):
+        raise ValueError("Экспорт поддерживает только StandardScaler(with_mean=False)")
+    if not hasattr(clf, 'coef_') or len(steps) not in (2, 3):
+        raise ValueError("Экспорт поддерживает только линейный классификатор последним шагом")
+
+    # слова в UTF-8 по возрастанию (порядок байтов UTF-8 совпадает с порядком строк) и их столбцы:
+    # поиск слова - np.searchsorted по массиву с диска, без словаря в памяти
+    terms = sorted(vectorizer.vocabulary_)
+    encoded = [term.encode('utf-8') for term in terms]
+    arrays = {
+        'vocabulary': np.array(encoded, dtype=f"S{max(map(len, encoded), default=1)}"),
+        'columns': np.array([vectorizer.vocabulary_[term] for term in terms], dtype=np.int64),
+        'coef': np.ascontiguousarray(clf.coef_, dtype=np.float64),
+        'intercept': np.asarray(clf.intercept_, dtype=np.float64),
+    }
+    if vectorizer.use_idf:
+        arrays['idf'] = np.asarray(vectorizer.idf_, dtype=np.float64)
+    if scaler is not None and scaler.scale_ is not None:
+        arrays['scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, ARRAY_FILES[name]), array)
+
+    manifest = {
+        'version': ARRAYS_VERSION,
+        'n_features': len(terms),
+        'classes': clf.classes_.tolist(),
+        'lowercase': vectorizer.lowercase,
+        'token_pattern': vectorizer.token_pattern,
+        'ngram_range': list(vectorizer.ngram_range),
+        'binary': vectorizer.binary,
+        'sublinear_tf': vectorizer.sublinear_tf,
+        'norm': vectorizer.norm,
+        'files': {name: ARRAY_FILES[name] for name in arrays},
+    }
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def is_linear_export(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+class LinearTextScorer:
+    # повторяет TfidfVectorizer -> StandardScaler -> predict линейной модели на массивах из
+    # export_linear_model. Массивы открываются через mmap и читаются с диска по мере надобности
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != ARRAYS_VERSION:
+            raise ValueError(f"Неподдерживаемая версия экспорта модели: {manifest.get('version')}")
+
+        arrays = {name: np.load(os.path.join(path, filename), mmap_mode='r')
+                  for name, filename in manifest['files'].items()}
+
+        self.vocabulary = arrays['vocabulary']
+        self.columns = arrays['columns']
+        self.idf = arrays.get('idf')
+        self.scale = arrays.get('scale')
+        self.coef = arrays['coef']
+        self.intercept = arrays['intercept']
+        self.classes = np.array(manifest['classes'])
+
+        self.token_pattern = re.compile(manifest['token_pattern'])
+        self.lowercase = manifest['lowercase']
+        self.ngram_range = tuple(manifest['ngram_range'])
+        self.binary = manifest['binary']
+        self.sublinear_tf = manifest['sublinear_tf']
+        self.norm = manifest['norm']
+
+    def analyze(self, text):
+        # тот же разбор, что у TfidfVectorizer(analyzer='word'): токены, затем n-граммы через пробел
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+
+        ngrams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n + 1, len(tokens) + 1)):
+            for i in range(len(tokens) - n + 1):
+                ngrams.append(' '.join(tokens[i:i + n]))
+        return ngrams
+
+    def lookup(self, terms):
+        # столбцы слов словаря среди terms (с повторами); слова длиннее самого длинного в словаре
+        # отбрасываются сразу, иначе приведение к ширине массива обрезало бы их до чужого слова
+        vocabulary = self.vocabulary
+        width = vocabulary.dtype.itemsize
+        encoded = [term for term in (term.encode('utf-8') for term in terms) if len(term) <= width]
+        if not encoded or not len(vocabulary):
+            return np.empty(0, dtype=np.intp)
+
+        queries = np.array(encoded, dtype=vocabulary.dtype)
+        positions = np.searchsorted(vocabulary, queries)
+        found = positions < len(vocabulary)
+        found[found] = vocabulary[positions[found]] == queries[found]
+        return self.columns[positions[found]]
+
+    def features(self, text):
+        # (столбцы по возрастанию, веса) одного текста после tf-idf, нормировки и масштабирования
+        columns, counts = np.unique(self.lookup(self.analyze(text)), return_counts=True)
+        columns = columns.astype(np.intp)
+        values = counts.astype(np.float64)
+        if self.binary:
+            values[:] = 1.0
+        elif self.sublinear_tf:
+            values = np.log(values) + 1.0
+        if self.idf is not None:
+            values *= self.idf[columns]
+
+        if self.norm == 'l2':
+            norm = math.sqrt(np.dot(values, values))
+        elif self.norm == 'l1':
+            norm = np.abs(values).sum()
+        else:
+            norm = 0.0
+        if norm > 0:
+            values /= norm
+
+        if self.scale is not None:
+            # StandardScaler делит умножением на обратный масштаб - так же и здесь, до последнего бита;
+            # масштаб остается на диске, обратные значения считаются только для столбцов текста
+            values *= 1.0 / self.scale[columns]
+        return columns, values
+
+    def decision_function(self, texts):
+        scores = np.empty((len(texts), self.coef.shape[0]))
+        for i, text in enumerate(texts):
+            columns, values = self.features(text)
+            scores[i] = self.coef[:, columns] @ values + self.intercept
+        return scores
+
+    def predict(self, texts):
+        scores = self.decision_function(texts)
+        if scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(int)]
+        return self.classes[scores.argmax(axis=1)]
@@ -0,0 +1,258 @@
+# python ngram_index.py --dictionary russian.utf-8
+# python ngram_index.py --dictionary russian.utf-8 --word малако --max-distance 2
+import argparse
+import bisect
+import json
+import os
+import time
+
+import numpy as np
+
+from file_utils import file_sha256, pack_strings, unpack_strings
+from levenshtein_batch import batch_levenshtein
+
+NGRAM_INDEX_VERSION = 2
+Q = 3
+PAD = '\x01' * (Q - 1)
+
+
+def default_ngram_index_path(dict_path):
+    return f"{dict_path}.ngrams"
+
+
+def ngram_tokens(word):
+    # триграммы слова с краями PAD; повторная триграмма получает номер вхождения,
+    # поэтому число общих токенов двух слов - пересечение мультимножеств их триграмм
+    padded = PAD + word + PAD
+    seen = {}
+    tokens = []
+    for i in range(len(word) + Q - 1):
+        gram = padded[i:i + Q]
+        occurrence = seen.get(gram, 0)
+        seen[gram] = occurrence + 1
+        tokens.append(gram if occurrence == 0 else gram + str(occurrence))
+    return tokens
+
+
+class NgramIndex:
+    # инвертированный индекс триграмм по уникальным ключам словаря (строка в нижнем регистре).
+    # Если расстояние Левенштейна между A и B не больше k, у них не меньше
+    # max(|A|, |B|) + Q - 1 - k * Q общих триграмм: по этому порогу отбираются кандидаты,
+    # а расстояние считается только для них. ranks[i] - позиция первого вхождения ключа
+    # в словаре: при равных расстояниях побеждает меньшая, как у min() при полном переборе.
+    # Кандидаты проверяются пачками одной длины через batch_levenshtein
+    def __init__(self, keys, words, ranks, tokens, token_offsets, postings):
+        self.keys = keys
+        self.words = words
+        self.ranks = ranks
+        self.lengths = np.array([len(key) for key in keys], dtype=np.int32)
+        self.token_ids = {token: i for i, token in enumerate(tokens)}
+        self.tokens = tokens
+        self.token_offsets = token_offsets
+        self.postings = postings
+        self.checked = 0
+
+        # коды символов ключей по длинам, как в pack_length_dict; rows[узел] - строка в своей группе
+        self.rows = np.empty(len(keys), dtype=np.int64)
+        self.codes = {}
+        for length in np.unique(self.lengths).tolist():
+            nodes = np.flatnonzero(self.lengths == length)
+            self.rows[nodes] = np.arange(len(nodes))
+            codes = np.frombuffer(''.join(keys[node] for node in nodes.tolist()).encode('utf-32-le'), dtype=np.uint32)
+            self.codes[length] = codes.reshape(len(nodes), length)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def levels(self, word, lengths=None):
+        # для каждого ключа - наименьшее k, при котором он проходит фильтр по триграммам и длине;
+        # ключи вне lengths получают -1
+        postings = [self.postings[self.token_offsets[i]:self.token_offsets[i + 1]]
+                    for i in (self.token_ids.get(token) for token in ngram_tokens(word)) if i is not None]
+        if postings:
+            shared = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+        else:
+            shared = np.zeros(len(self.keys), dtype=np.int64)
+
+        length_diff = np.abs(self.lengths - len(word))
+        missing = np.maximum(self.lengths, len(word)) + Q - 1 - shared
+        levels = np.maximum(-(-missing // Q), length_diff)
+
+        if lengths is not None:
+            levels[~np.isin(self.lengths, [length for length in lengths if length > 0])] = -1
+        return levels
+
+    def distances(self, word, nodes):
+        # расстояния Левенштейна от word до ключей nodes, по группам одной длины
+        self.checked += len(nodes)
+        distances = np.empty(len(nodes), dtype=np.int64)
+        node_lengths = self.lengths[nodes]
+        for length in np.unique(node_lengths).tolist():
+            group = np.flatnonzero(node_lengths == length)
+            distances[group] = batch_levenshtein(word, self.codes[length][self.rows[nodes[group]]])
+        return distances
+
+    def nearest(self, word, count, lengths=None):
+        # count ближайших слов [(слово словаря, расстояние)] по возрастанию расстояния,
+        # при равном расстоянии - в порядке словаря; каждый ключ один раз.
+        # lengths ограничивает длины кандидатов и задает их порядок при ничьей,
+        # как полный перебор closest_word_batch(word, packed, lengths) из levenshtein_batch
+        if not self.keys or count <= 0:
+            return []
+
+        length_order = None
+        if lengths is not None:
+            length_order = {}
+            for i, length in enumerate(lengths):
+                length_order.setdefault(length, i)
+
+        levels = self.levels(word, lengths)
+        keys = self.keys
+        # best - до count троек (расстояние, ранг, узел), отсортированных по возрастанию
+        best = []
+        max_level = int(levels.max())
+
+        # уровень k содержит все ключи с расстоянием не больше k: как только худшее из
+        # count найденных расстояний не больше k, остальные уровни его уже не улучшат
+        for level in range(max_level + 1):
+            if len(best) == count and best[-1][0] <= level - 1:
+                break
+            nodes = np.flatnonzero(levels == level)
+            if not len(nodes):
+                continue
+            distances = self.distances(word, nodes)
+            if len(best) == count:
+                keep = distances <= best[-1][0]
+                nodes, distances = nodes[keep], distances[keep]
+            for node, distance in zip(nodes.tolist(), distances.tolist()):
+                rank = self.ranks[node] if length_order is None else (length_order[len(keys[node])], self.ranks[node])
+                item = (distance, rank, node)
+                if len(best) == count:
+                    if item >= best[-1]:
+                        continue
+                    best.pop()
+                bisect.insort(best, item)
+
+        return [(self.words[node], distance) for distance, _, node in best]
+
+    def closest(self, word, lengths=None):
+        # то же, что closest_word(word, словарь, key=str.lower) - (слово словаря, расстояние)
+        found = self.nearest(word, 1, lengths)
+        return found[0] if found else (None, None)
+
+    def within(self, word, max_distance, lengths=None):
+        # [(слово словаря, расстояние)] для ключей не дальше max_distance,
+        # по возрастанию расстояния, затем в порядке словаря; каждый ключ один раз
+        levels = self.levels(word, lengths)
+        nodes = np.flatnonzero((levels >= 0) & (levels <= max_distance))
+        distances = self.distances(word, nodes)
+        keep = distances <= max_distance
+        found = sorted((distance, self.ranks[node], node)
+                       for node, distance in zip(nodes[keep].tolist(), distances[keep].tolist()))
+        return [(self.words[node], distance) for distance, _, node in found]
+
+
+def build_ngram_index(candidates):
+    # узлы - уникальные ключи candidate.lower() в порядке первого вхождения
+    keys = []
+    words = []
+    ranks = []
+    token_postings = {}
+    seen = set()
+
+    for position, candidate in enumerate(candidates):
+        key = candidate.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+
+        node = len(keys)
+        keys.append(key)
+        words.append(candidate)
+        ranks.append(position)
+        for token in ngram_tokens(key):
+            token_postings.setdefault(token, []).append(node)
+
+    tokens = list(token_postings)
+    token_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    token_offsets[1:] = np.cumsum([len(token_postings[token]) for token in tokens])
+    postings = np.fromiter((node for token in tokens for node in token_postings[token]),
+                           dtype=np.int32, count=int(token_offsets[-1]))
+
+    return NgramIndex(keys, words, ranks, tokens, token_offsets, postings)
+
+
+def save_ngram_index(index, index_path, header):
+    arrays = {
+        'header': np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8),
+        'keys': pack_strings(index.keys),
+        'ranks': np.array(index.ranks, dtype=np.int64),
+        'tokens': pack_strings(index.tokens),
+        'token_offsets': index.token_offsets,
+        'postings': index.postings,
+    }
+    # исходные слова хранятся, только если где-то регистр отличается от ключа
+    if index.words != index.keys:
+        arrays['words'] = pack_strings(index.words)
+
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temp_path, index_path)
+
+
+def load_ngram_index(index_path, header):
+    try:
+        with np.load(index_path, allow_pickle=False) as data:
+            if json.loads(data['header'].tobytes().decode('utf-8')) != header:
+                return None
+            ranks = data['ranks'].tolist()
+            token_offsets = data['token_offsets']
+            keys = unpack_strings(data['keys'], len(ranks))
+            words = unpack_strings(data['words'], len(ranks)) if 'words' in data.files else keys
+            tokens = unpack_strings(data['tokens'], len(token_offsets) - 1)
+            return NgramIndex(keys, words, ranks, tokens, token_offsets, data['postings'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_or_build_ngram_index(dict_path, index_path=None):
+    # индекс по строкам словаря (без пустых) строится один раз и лежит рядом со словарем
+    index_path = index_path or default_ngram_index_path(dict_path)
+    header = {'version': NGRAM_INDEX_VERSION, 'q': Q, 'dictionary': file_sha256(dict_path)}
+
+    if os.path.exists(index_path):
+        index = load_ngram_index(index_path, header)
+        if index is not None:
+            return index
+        print(f"Индекс {index_path} устарел, строится заново")
+
+    print(f"Построение индекса триграмм для {dict_path}...")
+    start = time.time()
+    with open(dict_path, 'r', encoding='utf-8') as f:
+        candidates = [line.strip() for line in f if line.strip()]
+    index = build_ngram_index(candidates)
+    save_ngram_index(index, index_path, header)
+    print(f"Индекс ({len(index)} слов) построен за {time.time() - start:.1f} сек и сохранен в {index_path}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Индекс триграмм словаря для поиска ближайшего слова.')
+    parser.add_argument('--dictionary', required=True, help='Файл словаря, слово на строке')
+    parser.add_argument('--index', help='Файл индекса (по умолчанию <словарь>.ngrams)')
+    parser.add_argument('--word', help='Найти ближайшее слово')
+    parser.add_argument('--max-distance', type=int, help='Вместо ближайшего - все слова не дальше порога')
+
+    args = parser.parse_args()
+
+    index = load_or_build_ngram_index(args.dictionary, args.index)
+    if args.word:
+        word = args.word.lower()
+        if args.max_distance is None:
+            res, distance = index.closest(word)
+            print(f"{res}: {distance}")
+        else:
+            for res, distance in index.within(word, args.max_distance):
+                print(f"{res}: {distance}")
+        print(f"Проверено слов: {index.checked} из {len(index)}")
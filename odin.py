@@ -1,33 +1,115 @@
-def levenshtein(s1, s2):
-    len1, len2 = len(s1), len(s2)
-    if len1 > len2:
-        s1, s2 = s2, s1
-        len1, len2 = len2, len1
-
-    current = range(len1 + 1)
-    for i in range(1, len2 + 1):
-        previous, current = current, [i] + [0] * len1
-        for j in range(1, len1 + 1):
-            add = previous[j] + 1
-            delete = current[j - 1] + 1
-            change = previous[j - 1]
-            if s1[j - 1] != s2[i - 1]:
-                change += 1
-            current[j] = min(add, delete, change)
-
-    return current[len1]
-
-
-with open('russian.utf-8', 'r', encoding='utf-8') as f:
-    dictionary = [line.strip() for line in f if line.strip()]
-
-word = input("Введите слово: ").lower()
-
-if dictionary:
-    res = min(dictionary, key=lambda w: levenshtein(word, w.lower()))
-    distance = levenshtein(word, res.lower())
-
-    print(f"Самое близкое слово: {res}")
-    print(f"Расстояние Левенштейна: {distance}")
-else:
-    print("Словарь пуст")
+# python odin.py                                   - одно слово с клавиатуры
+# python odin.py --batch words.txt --top 5         - слова из файла, по одному на строке
+# cat words.txt | python odin.py --batch - --workers 4 --output nearest.tsv
+import argparse
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from functools import partial
+from multiprocessing import Pool, get_start_method
+
+from ngram_index import load_or_build_ngram_index
+
+DICTIONARY_FILE = 'russian.utf-8'
+BATCH_CHUNK_SIZE = 64
+
+index = None
+
+
+def init_worker(dict_path):
+    # только для spawn/forkserver (Windows, macOS): при fork процесс получает уже загруженный
+    # индекс главного процесса. Файл .ngrams к этому моменту уже построен
+    global index
+    index = load_or_build_ngram_index(dict_path)
+
+
+def nearest_words(word, top):
+    return word, index.nearest(word, top)
+
+
+def read_queries(source):
+    if source == '-':
+        # stdin не закрывается: он принадлежит процессу, а не этой функции
+        words = [line.strip().lower() for line in sys.stdin if line.strip()]
+    else:
+        with open(source, 'r', encoding='utf-8') as lines:
+            words = [line.strip().lower() for line in lines if line.strip()]
+    # повторы считаются один раз
+    return list(dict.fromkeys(words))
+
+
+def run_batch(dict_path, source, output, top, workers):
+    global index
+    start = time.time()
+    # сообщения о построении индекса не должны попасть в результаты в stdout
+    with redirect_stdout(sys.stderr):
+        index = load_or_build_ngram_index(dict_path)
+    load_time = time.time() - start
+
+    queries = read_queries(source)
+    if not len(index):
+        print("Словарь пуст", file=sys.stderr)
+        return
+
+    out = sys.stdout if output == '-' else open(output, 'w', encoding='utf-8')
+    start = time.time()
+    try:
+        if workers > 1 and len(queries) > BATCH_CHUNK_SIZE:
+            forked = get_start_method() == 'fork'
+            with Pool(workers, initializer=None if forked else init_worker,
+                      initargs=() if forked else (dict_path,)) as pool:
+                results = pool.imap(partial(nearest_words, top=top), queries, chunksize=BATCH_CHUNK_SIZE)
+                write_results(out, results)
+        else:
+            write_results(out, (nearest_words(word, top) for word in queries))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.time() - start
+
+    # сводка в stderr, чтобы не смешиваться с результатами в stdout
+    print(f"Словарь загружен за {load_time:.2f} сек", file=sys.stderr)
+    print(f"Запросов: {len(queries)}, время: {elapsed:.2f} сек, "
+          f"{len(queries) / elapsed if elapsed > 0 else 0:.1f} запросов/сек", file=sys.stderr)
+
+
+def write_results(out, results):
+    # строка на запрос: слово и через табуляцию кандидаты в виде слово:расстояние
+    for word, found in results:
+        out.write('\t'.join([word] + [f"{res}:{distance}" for res, distance in found]) + '\n')
+
+
+def run_interactive(dict_path):
+    # индекс триграмм словаря строится при первом запуске и сохраняется в russian.utf-8.ngrams
+    index = load_or_build_ngram_index(dict_path)
+
+    word = input("Введите слово: ").lower()
+
+    if len(index):
+        res, distance = index.closest(word)
+
+        print(f"Самое близкое слово: {res}")
+        print(f"Расстояние Левенштейна: {distance}")
+    else:
+        print("Словарь пуст")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск ближайших слов словаря по расстоянию Левенштейна.')
+    parser.add_argument('--dictionary', default=DICTIONARY_FILE, help='Файл словаря, слово на строке')
+    parser.add_argument('--batch', metavar='FILE', help='Файл со словами для пакетного режима ("-" - stdin)')
+    parser.add_argument('--top', type=int, default=1, help='Сколько ближайших слов выводить на запрос')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Число процессов')
+    parser.add_argument('--output', default='-', help='Файл результатов (по умолчанию stdout)')
+
+    args = parser.parse_args()
+
+    if args.batch is None:
+        run_interactive(args.dictionary)
+    else:
+        run_batch(args.dictionary, args.batch, args.output, args.top, args.workers)
+
+
+if __name__ == "__main__":
+    main()
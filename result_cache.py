@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+
+RESULT_CACHE_VERSION = 1
+
+
+def pair_key(webres_content, image_content):
+    # ключ пары - хеш содержимого webRes и изображения, а не имен и дат файлов.
+    # Хешируются те же байты, что затем уходят на разбор и детекцию
+    digest = hashlib.sha256()
+    for content in (webres_content, image_content):
+        digest.update(content)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # результаты сопоставления (задание -> текст) для уже обработанных пар.
+    # version описывает модель и словарь: при их смене кеш с диска не используется
+    def __init__(self, path, version):
+        self.path = path
+        self.version = dict(version, cache_version=RESULT_CACHE_VERSION)
+        self.entries = {}
+        self.changed = False
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('version') == self.version:
+                self.entries = data.get('entries', {})
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, task_texts):
+        self.entries[key] = task_texts
+        self.changed = True
+
+    def keep_only(self, keys):
+        # записи пар, которых нет среди keys (в текущем запуске), удаляются: файл не растет
+        # от запуска к запуску
+        entries = {key: self.entries[key] for key in keys if key in self.entries}
+        if len(entries) != len(self.entries):
+            self.entries = entries
+            self.changed = True
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'entries': self.entries}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self.changed = False
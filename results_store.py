@@ -0,0 +1,234 @@
+# python results_store.py --db results.sqlite --import results.txt
+# python results_store.py --db results.sqlite --work 1019641987
+import argparse
+import os
+import sqlite3
+from itertools import groupby
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_id TEXT PRIMARY KEY,
+    work_id TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    page_id TEXT NOT NULL,
+    work_id TEXT NOT NULL,
+    task_num INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (page_id, task_num)
+);
+CREATE INDEX IF NOT EXISTS tasks_by_work ON tasks (work_id, task_num);
+CREATE INDEX IF NOT EXISTS tasks_by_task ON tasks (task_num);
+"""
+
+STORE_EXTENSIONS = ('.sqlite', '.db')
+
+
+def work_id_of(page_id):
+    # 1019641987_02 -> 1019641987
+    return page_id.rsplit('_', 1)[0]
+
+
+def parse_legacy(results_file):
+    # старый текстовый формат: строка с именем страницы, затем строки 'Задание N: "текст"'.
+    # Выдает (page_id, задания страницы в порядке файла)
+    page_id = None
+    tasks = []
+
+    with open(results_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            if 'Задание' not in line:
+                if page_id is not None:
+                    yield page_id, tasks
+                page_id = line
+                tasks = []
+            else:
+                if page_id is None:
+                    continue
+
+                parts = line.split(':', 1)
+                if len(parts) < 2:
+                    continue
+
+                task_label = parts[0].replace('Задание', '').strip()
+                text = parts[1].strip().strip('"')
+                tasks.append((task_label, text))
+
+    if page_id is not None:
+        yield page_id, tasks
+
+
+def write_legacy(grouped_results, output_file):
+    # grouped_results: {page_id: {номер задания: текст}}
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for page_id in sorted(grouped_results.keys()):
+            f.write(f"{page_id}\n")
+
+            tasks = grouped_results[page_id]
+            for task_label in sorted(tasks.keys(), key=lambda x: int(x)):
+                f.write(f"Задание {task_label}: \"{tasks[task_label]}\"\n")
+
+            f.write("\n")
+
+
+def group_works(pages, task_range=None):
+    # {work_id: {номер задания: текст}}; тексты одного задания с разных страниц склеиваются
+    works = {}
+    for page_id, tasks in pages:
+        work = works.setdefault(work_id_of(page_id), {})
+        for task_label, text in tasks:
+            if not task_label.isdigit():
+                continue
+            if task_range is not None and int(task_label) not in task_range:
+                continue
+            if task_label in work:
+                work[task_label] += " " + text
+            else:
+                work[task_label] = text
+    return works
+
+
+class ResultsStore:
+    # результаты распознавания в SQLite с индексом по работе и номеру задания
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, grouped_results):
+        # полностью заменяет содержимое хранилища
+        with self.connection:
+            self.connection.execute("DELETE FROM tasks")
+            self.connection.execute("DELETE FROM pages")
+            self._insert(sorted(grouped_results.items()))
+
+    def import_legacy(self, results_file):
+        with self.connection:
+            self.connection.execute("DELETE FROM tasks")
+            self.connection.execute("DELETE FROM pages")
+            self._insert(parse_legacy(results_file))
+
+    def _insert(self, pages):
+        for position, (page_id, tasks) in enumerate(pages):
+            work_id = work_id_of(page_id)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages (page_id, work_id, position) VALUES (?, ?, ?)",
+                (page_id, work_id, position))
+            items = tasks.items() if isinstance(tasks, dict) else tasks
+            for task_label, text in items:
+                if not str(task_label).isdigit():
+                    continue
+                # в старом формате задание может повторяться на странице - тексты склеиваются
+                row = self.connection.execute(
+                    "SELECT text FROM tasks WHERE page_id = ? AND task_num = ?",
+                    (page_id, int(task_label))).fetchone()
+                if row:
+                    text = row[0] + " " + text
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO tasks (page_id, work_id, task_num, text) VALUES (?, ?, ?, ?)",
+                    (page_id, work_id, int(task_label), text))
+
+    def pages(self, work_id=None):
+        # [(page_id, [(номер задания, текст), ...])] в порядке страниц
+        query = "SELECT page_id FROM pages"
+        params = ()
+        if work_id is not None:
+            query += " WHERE work_id = ?"
+            params = (work_id,)
+        page_ids = [row[0] for row in self.connection.execute(query + " ORDER BY position", params)]
+
+        tasks = {page_id: [] for page_id in page_ids}
+        query = "SELECT page_id, task_num, text FROM tasks"
+        if work_id is not None:
+            query += " WHERE work_id = ?"
+        for page_id, task_num, text in self.connection.execute(query + " ORDER BY task_num", params):
+            tasks[page_id].append((str(task_num), text))
+
+        return [(page_id, tasks[page_id]) for page_id in page_ids]
+
+    def works(self, task_range=None):
+        return group_works(self.pages(), task_range)
+
+    def iter_works(self, task_range=None):
+        # то же, что works(), но по одной работе за раз: работы в порядке первой страницы,
+        # строки одной работы идут подряд, в памяти только текущая работа
+        rows = self.connection.execute(
+            "SELECT pages.work_id, pages.page_id, tasks.task_num, tasks.text FROM pages "
+            "JOIN (SELECT work_id, MIN(position) AS first FROM pages GROUP BY work_id) AS firsts "
+            "ON firsts.work_id = pages.work_id "
+            "LEFT JOIN tasks ON tasks.page_id = pages.page_id "
+            "ORDER BY firsts.first, pages.position, tasks.task_num")
+        for _, work_rows in groupby(rows, key=lambda row: row[0]):
+            pages = [(page_id, [(str(task_num), text) for _, _, task_num, text in page_rows if task_num is not None])
+                     for page_id, page_rows in groupby(work_rows, key=lambda row: row[1])]
+            yield from group_works(pages, task_range).items()
+
+    def work(self, work_id, task_range=None):
+        return group_works(self.pages(work_id), task_range).get(work_id, {})
+
+    def task_texts(self, task_num):
+        # [(work_id, текст)] для одного задания по всем работам
+        rows = self.connection.execute(
+            "SELECT tasks.work_id, tasks.text FROM tasks JOIN pages USING (page_id) "
+            "WHERE tasks.task_num = ? ORDER BY pages.position", (int(task_num),))
+        works = {}
+        for work_id, text in rows:
+            works[work_id] = works[work_id] + " " + text if work_id in works else text
+        return list(works.items())
+
+    def export_legacy(self, output_file):
+        write_legacy({page_id: dict(tasks) for page_id, tasks in self.pages()}, output_file)
+
+
+def load_works(results_file, task_range=None):
+    # results.txt в старом формате или хранилище .sqlite/.db
+    if os.path.splitext(results_file)[1] in STORE_EXTENSIONS:
+        with ResultsStore(results_file) as store:
+            return store.works(task_range)
+    return group_works(parse_legacy(results_file), task_range)
+
+
+def iter_works(results_file, task_range=None):
+    # (work_id, {номер задания: текст}) по одной работе, без всех текстов в памяти.
+    # В results.txt страницы одной работы идут подряд: write_legacy пишет их по порядку имен
+    if os.path.splitext(results_file)[1] in STORE_EXTENSIONS:
+        with ResultsStore(results_file) as store:
+            yield from store.iter_works(task_range)
+        return
+    for _, pages in groupby(parse_legacy(results_file), key=lambda page: work_id_of(page[0])):
+        yield from group_works(pages, task_range).items()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Хранилище результатов распознавания.')
+    parser.add_argument('--db', required=True, help='Файл SQLite')
+    parser.add_argument('--import', dest='import_file', help='Загрузить results.txt в хранилище')
+    parser.add_argument('--export', dest='export_file', help='Выгрузить хранилище в формате results.txt')
+    parser.add_argument('--work', help='Показать задания одной работы')
+
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        if args.import_file:
+            store.import_legacy(args.import_file)
+            print(f"Загружено в {args.db}: {args.import_file}")
+        if args.export_file:
+            store.export_legacy(args.export_file)
+            print(f"Выгружено в {args.export_file}")
+        if args.work:
+            for task_label, text in store.work(args.work).items():
+                print(f"Задание {task_label}: \"{text}\"")
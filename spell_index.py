@@ -0,0 +1,108 @@
+# python spell_index.py --dictionary ru_full.txt --max-edit-distance 3 --prefix-length 7
+import argparse
+import os
+import pickle
+
+from symspellpy import SymSpell
+
+from file_utils import file_sha256
+
+INDEX_VERSION = 1
+
+
+def index_header(dict_path, max_dictionary_edit_distance, prefix_length, word_list):
+    # индекс годится, только если совпадают версия формата, словарь и параметры
+    return {
+        'version': INDEX_VERSION,
+        'dictionary': file_sha256(dict_path),
+        'max_dictionary_edit_distance': max_dictionary_edit_distance,
+        'prefix_length': prefix_length,
+        'word_list': word_list,
+    }
+
+
+def default_index_path(dict_path, max_dictionary_edit_distance, prefix_length):
+    return f"{dict_path}.d{max_dictionary_edit_distance}p{prefix_length}.symspell"
+
+
+def build_symspell(dict_path, max_dictionary_edit_distance=2, prefix_length=7, word_list=False):
+    sym_spell = SymSpell(max_dictionary_edit_distance=max_dictionary_edit_distance,
+                         prefix_length=prefix_length)
+
+    if word_list:
+        # словарь - просто список слов, у всех слов частота 1
+        with open(dict_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                word = line.strip()
+                if word:
+                    sym_spell.create_dictionary_entry(word, 1)
+    else:
+        sym_spell.load_dictionary(dict_path, term_index=0, count_index=1, encoding='utf-8')
+
+    return sym_spell
+
+
+def save_index(sym_spell, index_path, header):
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.write(sym_spell.save_pickle(to_bytes=True))
+    os.replace(temp_path, index_path)
+
+
+def load_index(index_path, header):
+    if not os.path.exists(index_path):
+        return None
+
+    with open(index_path, 'rb') as f:
+        try:
+            stored_header = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError):
+            return None
+        if stored_header != header:
+            return None
+        payload = f.read()
+
+    sym_spell = SymSpell(max_dictionary_edit_distance=header['max_dictionary_edit_distance'],
+                         prefix_length=header['prefix_length'])
+    if not sym_spell.load_pickle(payload, from_bytes=True):
+        return None
+
+    return sym_spell
+
+
+def load_or_build_symspell(dict_path, max_dictionary_edit_distance=2, prefix_length=7,
+                           word_list=False, index_path=None):
+    if index_path is None:
+        index_path = default_index_path(dict_path, max_dictionary_edit_distance, prefix_length)
+
+    header = index_header(dict_path, max_dictionary_edit_distance, prefix_length, word_list)
+    sym_spell = load_index(index_path, header)
+
+    if sym_spell is None:
+        print(f"Построение индекса SymSpell для {dict_path}...")
+        sym_spell = build_symspell(dict_path, max_dictionary_edit_distance, prefix_length, word_list)
+        save_index(sym_spell, index_path, header)
+        print(f"Индекс сохранен в {index_path}")
+
+    return sym_spell
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Построение индекса SymSpell.')
+    parser.add_argument('--dictionary', required=True, help='Файл словаря')
+    parser.add_argument('--max-edit-distance', type=int, default=2, help='Максимальное расстояние')
+    parser.add_argument('--prefix-length', type=int, default=7, help='Длина префикса')
+    parser.add_argument('--word-list', action='store_true', help='Словарь без частот, одно слово в строке')
+    parser.add_argument('--output', default=None, help='Файл индекса')
+
+    args = parser.parse_args()
+
+    index_path = args.output or default_index_path(
+        args.dictionary, args.max_edit_distance, args.prefix_length)
+    header = index_header(args.dictionary, args.max_edit_distance, args.prefix_length, args.word_list)
+    save_index(
+        build_symspell(args.dictionary, args.max_edit_distance, args.prefix_length, args.word_list),
+        index_path, header
+    )
+    print(f"Индекс сохранен в {index_path}")
@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import threading
+import zipfile
+
+import joblib
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+
+BUNDLE_VERSION = 1
+BUNDLE_EXTENSIONS = ('.zip',)
+MANIFEST = 'manifest.json'
+VECTORIZER_MEMBER = 'vectorizer.joblib'
+
+
+class FeatureSubset(BaseEstimator, TransformerMixin):
+    # оставляет столбцы общего словаря, которые встречались в текстах задания.
+    # Для остальных у классификатора задания все равно нулевые веса, а место они занимают
+    def fit(self, X, y=None):
+        self.columns_ = np.flatnonzero(X.getnnz(axis=0)).astype(np.int32)
+        return self
+
+    def transform(self, X):
+        return X[:, self.columns_]
+
+
+def task_member(task_num):
+    return f'task_{task_num}.joblib'
+
+
+def is_bundle(path):
+    return path.lower().endswith(BUNDLE_EXTENSIONS)
+
+
+def dump_member(archive, name, obj):
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer, compress=3)
+    archive.writestr(name, buffer.getvalue())
+
+
+def save_task_bundle(path, vectorizer, models, meta=None):
+    # один файл: общий векторизатор и по маленькому классификатору на задание.
+    # models: {номер задания: классификатор над признаками vectorizer}
+    manifest = {
+        'version': BUNDLE_VERSION,
+        'vectorizer': VECTORIZER_MEMBER,
+        'tasks': {str(task_num): task_member(task_num) for task_num in models},
+        'meta': meta or {},
+    }
+
+    temp_path = path + '.tmp'
+    with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr(MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2))
+        dump_member(archive, VECTORIZER_MEMBER, vectorizer)
+        for task_num, model in models.items():
+            dump_member(archive, task_member(task_num), model)
+
+    os.replace(temp_path, path)
+
+
+class TaskModelBundle:
+    # модели заданий читаются из архива при первом обращении к заданию;
+    # векторизатор общий и загружается один раз
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.archive = zipfile.ZipFile(path)
+        self.manifest = json.loads(self.archive.read(MANIFEST))
+        if self.manifest.get('version') != BUNDLE_VERSION:
+            raise ValueError(f"Неподдерживаемая версия набора моделей: {self.manifest.get('version')}")
+        self.vectorizer = None
+        self.pipelines = {}
+
+    @property
+    def tasks(self):
+        return [int(task_num) for task_num in self.manifest['tasks']]
+
+    def _load(self, name):
+        with self.archive.open(name) as f:
+            return joblib.load(f)
+
+    def pipeline(self, task_num):
+        # векторизатор + классификатор задания как обычный Pipeline; None, если модели нет
+        task_key = str(task_num)
+        if task_key in self.pipelines:
+            return self.pipelines[task_key]
+
+        with self.lock:
+            if task_key not in self.pipelines:
+                pipeline = None
+                if task_key in self.manifest['tasks']:
+                    if self.vectorizer is None:
+                        self.vectorizer = self._load(self.manifest['vectorizer'])
+                    model = self._load(self.manifest['tasks'][task_key])
+                    pipeline = Pipeline([('vectorizer', self.vectorizer), ('clf', model)])
+                self.pipelines[task_key] = pipeline
+
+        return self.pipelines[task_key]
+
+    def close(self):
+        self.archive.close()
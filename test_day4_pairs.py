@@ -0,0 +1,84 @@
+import io
+import tarfile
+import zipfile
+
+import day4LastVers as day4
+from archive_sources import source_basename
+
+
+def write_tar(path, files):
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, content in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+
+
+def write_zip(path, files):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+
+
+def pair_names(webres_dir, images_dir):
+    return [(source_basename(webres_path), source_basename(image_path), webres_content, image_content)
+            for webres_path, image_path, webres_content, image_content in day4.iter_pairs(webres_dir, images_dir)]
+
+
+WEBRES_FILES = [('school/b__1.txt.webRes', b'b1'), ('school/a__1.txt.webRes', b'a1'),
+                ('school/c__1.txt.webRes', b'c1'), ('school/b__2.txt.webRes', b'b2')]
+IMAGE_FILES = [('a.png', b'A'), ('d.png', b'D'), ('b.png', b'B')]
+
+
+def test_two_tar_archives_are_read_in_their_own_order(tmp_path):
+    # у архивов разный порядок; c и d без пары; b - общее изображение двух webRes,
+    # второй из которых приходит уже после того, как изображение ушло в пару
+    webres, images = tmp_path / 'school.tar.gz', tmp_path / 'photo.tar.gz'
+    write_tar(webres, WEBRES_FILES)
+    write_tar(images, IMAGE_FILES)
+
+    assert pair_names(str(webres), str(images)) == [
+        ('a__1.txt.webRes', 'a.png', b'a1', b'A'),
+        ('b__1.txt.webRes', 'b.png', b'b1', b'B'),
+        ('b__2.txt.webRes', 'b.png', b'b2', b'B'),
+    ]
+
+
+def test_tar_webres_with_zip_images_follow_tar_order(tmp_path):
+    webres, images = tmp_path / 'school.tar.gz', tmp_path / 'photo.zip'
+    write_tar(webres, WEBRES_FILES)
+    write_zip(images, IMAGE_FILES)
+
+    assert pair_names(str(webres), str(images)) == [
+        ('b__1.txt.webRes', 'b.png', b'b1', b'B'),
+        ('a__1.txt.webRes', 'a.png', b'a1', b'A'),
+        ('b__2.txt.webRes', 'b.png', b'b2', b'B'),
+    ]
+
+
+def test_tar_images_skip_images_without_webres(tmp_path):
+    (tmp_path / 'school').mkdir()
+    for name, content in WEBRES_FILES:
+        (tmp_path / name).write_bytes(content)
+    images = tmp_path / 'photo.tar.gz'
+    write_tar(images, IMAGE_FILES)
+
+    assert pair_names(str(tmp_path / 'school'), str(images)) == [
+        ('a__1.txt.webRes', 'a.png', b'a1', b'A'),
+        ('b__1.txt.webRes', 'b.png', b'b1', b'B'),
+        ('b__2.txt.webRes', 'b.png', b'b2', b'B'),
+    ]
+
+
+def test_pairs_match_find_pairs_for_folders(tmp_path):
+    (tmp_path / 'school').mkdir()
+    (tmp_path / 'photo').mkdir()
+    for name in ('1__x.txt.webRes', '2__x.txt.webRes', '3__x.txt.webRes'):
+        (tmp_path / 'school' / name).write_bytes(name.encode())
+    for name in ('1.png', '3.png', '4.png'):
+        (tmp_path / 'photo' / name).write_bytes(name.encode())
+
+    webres_dir, images_dir = str(tmp_path / 'school'), str(tmp_path / 'photo')
+    pairs = [(webres_path, image_path) for webres_path, image_path, _, _ in day4.iter_pairs(webres_dir, images_dir)]
+    assert pairs == day4.find_pairs(webres_dir, images_dir)
+    assert [source_basename(image_path) for _, image_path in pairs] == ['1.png', '3.png']
@@ -0,0 +1,32 @@
+import pytest
+
+import day4LastVers as day4
+
+
+class FakeSymSpell:
+    words = {'класс', 'кто-то'}
+
+
+class FakeCorrectionCache:
+    def correct(self, word, verbosity, max_edit_distance=2):
+        return 'исправлено'
+
+
+@pytest.fixture
+def fake_dictionary(monkeypatch):
+    monkeypatch.setitem(day4.resources, 'sym_spell', FakeSymSpell())
+    monkeypatch.setitem(day4.resources, 'correction_cache', FakeCorrectionCache())
+
+
+def test_word_pattern_skips_tokens_with_digits_and_latin():
+    assert day4.WORD_PATTERN.findall('2-й класс fs-слово') == ['класс']
+    assert day4.WORD_PATTERN.findall('fs24 2х2 словоfs') == []
+
+
+def test_word_pattern_keeps_hyphenated_words():
+    assert day4.WORD_PATTERN.findall('Кто-то пере- ДОМ.') == ['Кто-то', 'пере', 'ДОМ']
+
+
+def test_correct_text_leaves_ordinals_and_mixed_tokens(fake_dictionary):
+    assert day4.correct_text('2-й класс fs-слово') == '2-й класс fs-слово'
+    assert day4.correct_text('Кто-то писал') == 'Кто-то исправлено'
@@ -0,0 +1,66 @@
+import json
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import day5
+
+CLIENTS = 6
+
+
+class ListScores(list):
+    def tolist(self):
+        return list(self)
+
+
+class StubModel:
+    # оценка - длина текста; запоминает размер каждой пачки
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, texts):
+        self.batch_sizes.append(len(texts))
+        return ListScores(len(text) for text in texts)
+
+
+@pytest.fixture
+def running_server():
+    model = StubModel()
+    # пачка уходит в модель, только когда придут тексты всех клиентов (по 2 на запрос):
+    # max_wait с большим запасом, чтобы медленный запуск потоков не разбил пачку
+    batcher = day5.MicroBatcher(model, max_batch=CLIENTS * 2, max_wait=5)
+    server = day5.GradingServer(('127.0.0.1', 0), batcher)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, model
+    server.shutdown()
+    server.server_close()
+
+
+def post_works(port, works):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/grade',
+                                     data=json.dumps({'works': works}).encode('utf-8'), method='POST')
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def test_concurrent_requests_share_one_batch(running_server):
+    server, model = running_server
+    requests = [{str(1000 + i): {'22': 'я' * (i + 1), '24': 'текст' * (i + 1)}} for i in range(CLIENTS)]
+
+    with ThreadPoolExecutor(max_workers=CLIENTS) as executor:
+        responses = list(executor.map(lambda works: post_works(server.server_port, works), requests))
+
+    assert model.batch_sizes == [CLIENTS * 2]
+    for i, response in enumerate(responses):
+        grades = response[str(1000 + i)]
+        assert grades['22'] == i + 1
+        assert grades['24'] == 5 * (i + 1)
+        assert grades['23'] == "Текст задания не найден"
+
+    stats = server.stats()
+    assert stats['batches'] == 1
+    assert stats['texts'] == CLIENTS * 2
+    assert stats['latency']['requests'] == CLIENTS
@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+
+from webres_stream import iter_text_boxes
+
+
+def recursive_boxes(data, lang='rus'):
+    # прежний разбор через json.load и рекурсию - эталон порядка боксов
+    boxes = []
+
+    def parse_element(element):
+        if isinstance(element, dict):
+            if 'languages' in element:
+                for language in element['languages']:
+                    if language.get('lang') == lang:
+                        for text_item in language.get('texts', []):
+                            text = text_item.get('text', '').strip()
+                            if text:
+                                boxes.append({'x': element.get('x', 0), 'y': element.get('y', 0),
+                                              'w': element.get('w', 0), 'h': element.get('h', 0),
+                                              'text': text})
+            for value in element.values():
+                parse_element(value)
+        elif isinstance(element, list):
+            for item in element:
+                parse_element(item)
+
+    parse_element(data)
+    return boxes
+
+
+def element(text, x, children=None):
+    item = {'languages': [{'lang': 'rus', 'texts': [{'text': text}]}], 'x': x, 'y': 1, 'w': 2, 'h': 3}
+    if children is not None:
+        item['boxes'] = children
+    return item
+
+
+def stream_boxes(data, chunk_size=16):
+    return list(iter_text_boxes(io.StringIO(json.dumps(data, ensure_ascii=False)), chunk_size=chunk_size))
+
+
+def test_nested_element_keeps_parent_before_child():
+    data = {'data': {'blocks': [element('parent', 10, [element('child', 20)])]}}
+    assert [box['text'] for box in stream_boxes(data)] == ['parent', 'child']
+    assert stream_boxes(data) == recursive_boxes(data)
+
+
+def test_children_before_languages_key_still_follow_parent():
+    parent = {'boxes': [element('first child', 20), element('second child', 30, [element('grandchild', 40)])]}
+    parent.update(element('parent', 10))
+    data = [parent, element('sibling', 50), {'languages': [{'lang': 'eng', 'texts': [{'text': 'skip'}]}]}]
+    assert [box['text'] for box in stream_boxes(data)] == [
+        'parent', 'first child', 'second child', 'grandchild', 'sibling']
+    assert stream_boxes(data) == recursive_boxes(data)
+
+
+def test_sample_webres_matches_recursive_parser():
+    try:
+        with open('input.txt.webRes', 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except OSError:
+        pytest.skip("нет input.txt.webRes")
+    with open('input.txt.webRes', 'r', encoding='utf-8') as f:
+        assert list(iter_text_boxes(f)) == recursive_boxes(data)
+
+
+class CountingReader(io.StringIO):
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.consumed = self.tell()
+        return chunk
+
+
+def test_first_block_is_yielded_before_input_ends():
+    blocks = [element(f'block {i}', i, [element(f'child {i}', i + 100)]) for i in range(50)]
+    text = json.dumps({'data': {'blocks': blocks}}, ensure_ascii=False)
+    f = CountingReader(text)
+    boxes = iter_text_boxes(f, chunk_size=64)
+    assert [next(boxes)['text'], next(boxes)['text']] == ['block 0', 'child 0']
+    assert f.consumed < len(text) // 10
+    assert [box['text'] for box in boxes][-1] == 'child 49'
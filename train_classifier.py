@@ -1,104 +1,91 @@
 # python train_classifier.py --results results.txt --grades classJS
+# python train_classifier.py --results results.sqlite --grades classJS --mode stream --search --n-jobs 4
 import os
-import json
+import time
+import zlib
 import joblib
 import argparse
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report
+from contextlib import contextmanager
+from joblib import Parallel, delayed
+from sklearn.dummy import DummyClassifier
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import GridSearchCV, KFold, train_test_split
+from sklearn.metrics import accuracy_score, classification_report
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 
+from grades_loader import load_grade_dir
+from instrumentation import peak_rss_mb
+from linear_scorer import export_linear_model
+from results_store import iter_works, load_works
+from task_models import FeatureSubset, save_task_bundle
 
 TASK_RANGE = range(22, 29)
 MODEL_FILE = "classification_model.joblib"
+MODEL_BUNDLE_FILE = "classification_models.zip"
+MODEL_EXPORT_DIR = "classification_model"
 
+TFIDF_PARAM_GRID = {'clf__C': [0.1, 1.0, 10.0]}
+STREAM_ALPHAS = [1e-5, 1e-4, 1e-3]
+STREAM_BATCH_SIZE = 1000  # текстов на один вызов partial_fit
+STREAM_EPOCHS = 5
+HASH_FEATURES = 2 ** 20
+HOLDOUT_BUCKETS = 5  # в проверку идет каждая пятая работа по хешу id, как test_size=0.2
 
-def load_grades(grades_dir):
-    grades = {}
-    for filename in os.listdir(grades_dir):
-        if filename.endswith('.json'):
-            filepath = os.path.join(grades_dir, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            work_id = data['id']
-            mask = data['mask']
-            scores = []
-
-            parts = mask.split(')')[:-1]
-            for part in parts:
-                score = part.split('(')[0]
-                scores.append(int(score))
 
-            grades[work_id] = scores
-
-    return grades
+def load_grades(grades_dir):
+    # файлы читаются в несколько потоков, разобранные оценки кешируются в <папка>.grades.npz
+    return load_grade_dir(grades_dir)
 
 
 def parse_results(results_file):
-    works = {}
-    current_work = None
-    current_base_id = None
-
-    with open(results_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-
-            if 'Задание' not in line:
-                current_work = line
-                current_base_id = line.rsplit('_', 1)[0]
-
-                if current_base_id not in works:
-                    works[current_base_id] = {}
-            else:
-                if not current_base_id:
-                    continue
-
-                parts = line.split(':', 1)
-                if len(parts) < 2:
-                    continue
-
-                task_num = parts[0].replace('Задание', '').strip()
-                text = parts[1].strip().strip('"')
-
-                if task_num.isdigit() and int(task_num) in TASK_RANGE:
-                    if task_num in works[current_base_id]:
-                        works[current_base_id][task_num] += " " + text
-                    else:
-                        works[current_base_id][task_num] = text
-
-    return works
+    # results.txt в старом формате или хранилище results.sqlite
+    return load_works(results_file, TASK_RANGE)
 
 
-def prepare_data(results_data, grades_data):
-    text = []  # Тексты заданий
-    gr = []  # Оценки
-
-    for work_id, tasks in results_data.items():
+def iter_examples(works, grades_data, work_ids=None):
+    # (work_id, номер задания, текст, оценка) по одному из пар (work_id, задания);
+    # work_ids ограничивает выборку набором работ
+    for work_id, tasks in works:
         if work_id not in grades_data:
             continue
+        if work_ids is not None and work_id not in work_ids:
+            continue
 
         scores = grades_data[work_id]
 
         for i, task_num in enumerate(TASK_RANGE):
             task_key = str(task_num)
             if task_key in tasks:
-                text.append(tasks[task_key])
-                gr.append(scores[i])
+                yield work_id, task_num, tasks[task_key], scores[i]
+
+
+def prepare_data(results_data, grades_data):
+    text = []  # Тексты заданий
+    gr = []  # Оценки
+
+    for _, _, task_text, score in iter_examples(results_data.items(), grades_data):
+        text.append(task_text)
+        gr.append(score)
 
     return text, gr
 
 
-def train_model(text, gr):
-    text_train, text_test, gr_train, gr_test = train_test_split(
-        text, gr, test_size=0.2, random_state=42
-    )
+@contextmanager
+def fit_report(label):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = peak_rss_mb()
+        memory = f", пик памяти процесса {peak:.0f} МБ" if peak is not None else ""
+        print(f"{label}: {elapsed:.1f} с{memory}")
 
-    model = Pipeline([
+
+def make_tfidf_model():
+    return Pipeline([
         ('tfidf', TfidfVectorizer(
             max_features=5000,
             ngram_range=(1, 2),
@@ -111,7 +98,29 @@ def train_model(text, gr):
         ))
     ])
 
-    model.fit(text_train, gr_train)
+
+def train_model(text, gr, search=False, folds=5, n_jobs=-1):
+    text_train, text_test, gr_train, gr_test = train_test_split(
+        text, gr, test_size=0.2, random_state=42
+    )
+
+    model = make_tfidf_model()
+
+    if search:
+        # перебор параметров с k-fold на обучающей части, фолды считаются параллельно
+        search_cv = GridSearchCV(model, TFIDF_PARAM_GRID, cv=KFold(folds, shuffle=True, random_state=42),
+                                 n_jobs=n_jobs)
+        with fit_report("Подбор параметров"):
+            search_cv.fit(text_train, gr_train)
+        for params, mean, std in zip(search_cv.cv_results_['params'],
+                                     search_cv.cv_results_['mean_test_score'],
+                                     search_cv.cv_results_['std_test_score']):
+            print(f"{params}: точность {mean:.3f} ± {std:.3f}")
+        print(f"Лучшие параметры: {search_cv.best_params_}")
+        model.set_params(**search_cv.best_params_)
+
+    with fit_report("Обучение"):
+        model.fit(text_train, gr_train)
 
     gr_pred = model.predict(text_test)
     print("\nОтчет о классификации:")
@@ -120,33 +129,262 @@ def train_model(text, gr):
     return model
 
 
-def main(results_file, grades_dir):
+def work_bucket(work_id, buckets):
+    # стабильное разбиение работ: не зависит от порядка данных и запуска
+    return zlib.crc32(work_id.encode('utf-8')) % buckets
+
+
+def iter_batches(examples, batch_size):
+    batch = []
+    for example in examples:
+        batch.append(example)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_file_examples(results_file, grades_data, work_ids=None):
+    # примеры прямо из results.txt или results.sqlite: работы читаются с диска по одной
+    return iter_examples(iter_works(results_file, TASK_RANGE), grades_data, work_ids)
+
+
+def fit_streaming(results_file, grades_data, work_ids, classes, alpha,
+                  epochs=STREAM_EPOCHS, batch_size=STREAM_BATCH_SIZE):
+    # HashingVectorizer не хранит словарь, поэтому признаки считаются по пачкам
+    # и модель дообучается через partial_fit: в памяти только одна пачка,
+    # каждая эпоха заново читает результаты с диска
+    vectorizer = HashingVectorizer(n_features=HASH_FEATURES, ngram_range=(1, 2), alternate_sign=False)
+    clf = SGDClassifier(loss='log_loss', alpha=alpha, random_state=42)
+
+    for _ in range(epochs):
+        for batch in iter_batches(iter_file_examples(results_file, grades_data, work_ids), batch_size):
+            texts = [task_text for _, _, task_text, _ in batch]
+            scores = [score for _, _, _, score in batch]
+            clf.partial_fit(vectorizer.transform(texts), scores, classes=classes)
+
+    return Pipeline([('hashing', vectorizer), ('clf', clf)])
+
+
+def predict_streaming(model, results_file, grades_data, work_ids, batch_size=STREAM_BATCH_SIZE):
+    gr_true = []
+    gr_pred = []
+    for batch in iter_batches(iter_file_examples(results_file, grades_data, work_ids), batch_size):
+        gr_true.extend(score for _, _, _, score in batch)
+        gr_pred.extend(model.predict([task_text for _, _, task_text, _ in batch]).tolist())
+    return gr_true, gr_pred
+
+
+def score_streaming(results_file, grades_dir, train_ids, test_ids, classes, alpha, epochs, batch_size):
+    # процесс получает пути и наборы id работ, а оценки берет из кеша <папка>.grades.npz
+    grades_data = load_grades(grades_dir)
+    model = fit_streaming(results_file, grades_data, train_ids, classes, alpha, epochs, batch_size)
+    gr_true, gr_pred = predict_streaming(model, results_file, grades_data, test_ids, batch_size)
+    return accuracy_score(gr_true, gr_pred) if gr_true else 0.0
+
+
+def search_streaming(results_file, grades_dir, train_ids, classes, folds, n_jobs, epochs, batch_size):
+    # k-fold по работам обучающей части для каждого alpha; все пары (alpha, фолд) - параллельно
+    work_ids = sorted(train_ids)
+    splits = list(KFold(folds, shuffle=True, random_state=42).split(work_ids))
+    jobs = [(alpha, {work_ids[i] for i in fold_train}, {work_ids[i] for i in fold_test})
+            for alpha in STREAM_ALPHAS for fold_train, fold_test in splits]
+
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(score_streaming)(results_file, grades_dir, fold_train, fold_test, classes, alpha, epochs, batch_size)
+        for alpha, fold_train, fold_test in jobs
+    )
+
+    best_alpha, best_score = None, -1.0
+    for i, alpha in enumerate(STREAM_ALPHAS):
+        fold_scores = scores[i * folds:(i + 1) * folds]
+        mean = sum(fold_scores) / folds
+        std = (sum((score - mean) ** 2 for score in fold_scores) / folds) ** 0.5
+        print(f"alpha={alpha:g}: точность {mean:.3f} ± {std:.3f}")
+        if mean > best_score:
+            best_alpha, best_score = alpha, mean
+
+    print(f"Лучший alpha: {best_alpha:g}")
+    return best_alpha
+
+
+def train_streaming(results_file, grades_dir, grades_data, search=False, folds=5, n_jobs=-1,
+                    epochs=STREAM_EPOCHS, batch_size=STREAM_BATCH_SIZE):
+    # оценки занимают мало памяти: по ним заранее известны все классы для partial_fit.
+    # Тексты в памяти не держатся - только id работ
+    work_ids = [work_id for work_id, _ in iter_works(results_file, TASK_RANGE) if work_id in grades_data]
+    classes = sorted({score for work_id in work_ids for score in grades_data[work_id]})
+    test_ids = {work_id for work_id in work_ids if work_bucket(work_id, HOLDOUT_BUCKETS) == 0}
+    train_ids = set(work_ids) - test_ids
+
+    alpha = STREAM_ALPHAS[1]
+    if search:
+        with fit_report("Подбор параметров"):
+            alpha = search_streaming(results_file, grades_dir, train_ids, classes, folds, n_jobs, epochs, batch_size)
+
+    with fit_report("Обучение"):
+        model = fit_streaming(results_file, grades_data, train_ids, classes, alpha, epochs, batch_size)
+
+    gr_test, gr_pred = predict_streaming(model, results_file, grades_data, test_ids, batch_size)
+    print("\nОтчет о классификации:")
+    print(classification_report(gr_test, gr_pred))
+
+    return model
+
+
+def train_task_models(results_data, grades_data):
+    # общий TF-IDF для всех заданий и по маленькому классификатору на каждое задание
+    splits = {}
+    for _, task_num, task_text, score in iter_examples(results_data.items(), grades_data):
+        texts, scores = splits.setdefault(task_num, ([], []))
+        texts.append(task_text)
+        scores.append(score)
+
+    for task_num, (texts, scores) in splits.items():
+        # на совсем маленьком задании проверочной части нет
+        if len(texts) >= 5:
+            splits[task_num] = train_test_split(texts, scores, test_size=0.2, random_state=42)
+        else:
+            splits[task_num] = (texts, [], scores, [])
+
+    with fit_report("Обучение"):
+        vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
+        vectorizer.fit([text for text_train, _, _, _ in splits.values() for text in text_train])
+        # отброшенные max_features слова нужны только для просмотра, а в файле занимают больше словаря
+        vectorizer.stop_words_ = None
+
+        models = {}
+        for task_num in sorted(splits):
+            text_train, _, gr_train, _ = splits[task_num]
+            if len(set(gr_train)) < 2:
+                # у задания одна оценка на все работы - учить нечему
+                models[task_num] = DummyClassifier(strategy='most_frequent')
+            else:
+                models[task_num] = Pipeline([
+                    ('features', FeatureSubset()),
+                    ('scaler', StandardScaler(with_mean=False)),
+                    ('clf', LogisticRegression(max_iter=1000, random_state=42))
+                ])
+            models[task_num].fit(vectorizer.transform(text_train), gr_train)
+
+    gr_test_all = []
+    gr_pred_all = []
+    for task_num in sorted(splits):
+        _, text_test, _, gr_test = splits[task_num]
+        if not text_test:
+            continue
+        gr_pred = models[task_num].predict(vectorizer.transform(text_test)).tolist()
+        print(f"Задание {task_num}: точность {accuracy_score(gr_test, gr_pred):.3f} на {len(gr_test)} примерах")
+        gr_test_all.extend(gr_test)
+        gr_pred_all.extend(gr_pred)
+
+    if gr_test_all:
+        print("\nОтчет о классификации:")
+        print(classification_report(gr_test_all, gr_pred_all))
+
+    return vectorizer, models
+
+
+def export_model(model_file=MODEL_FILE, export_dir=MODEL_EXPORT_DIR):
+    if not os.path.exists(model_file):
+        print(f"Ошибка: Модель {model_file} не найдена")
+        return
+
+    model = joblib.load(model_file)
+    export_linear_model(model, export_dir)
+    print(f"Массивы модели {model_file} выгружены в {export_dir}")
+
+
+def main(results_file, grades_dir, mode='tfidf', search=False, folds=5, n_jobs=-1,
+         epochs=STREAM_EPOCHS, batch_size=STREAM_BATCH_SIZE, per_task=False, export_dir=None):
     grades_data = load_grades(grades_dir)
-    results_data = parse_results(results_file)
 
-    text, gr = prepare_data(results_data, grades_data)
+    if per_task:
+        results_data = parse_results(results_file)
+        count = sum(1 for _ in iter_examples(results_data.items(), grades_data))
+        if not count:
+            print("Ошибка: Нет данных для обучения!")
+            return
+
+        print(f"Найдено {count} примеров для обучения")
 
-    if not text:
-        print("Ошибка: Нет данных для обучения!")
+        print("Обучение моделей по заданиям...")
+        vectorizer, models = train_task_models(results_data, grades_data)
+
+        save_task_bundle(MODEL_BUNDLE_FILE, vectorizer, models, {'tasks': sorted(models)})
+        print(f"\nМодели сохранены в {MODEL_BUNDLE_FILE} ({os.path.getsize(MODEL_BUNDLE_FILE) / 2 ** 20:.1f} МБ)")
         return
 
-    print(f"Найдено {len(text)} примеров для обучения")
+    if mode == 'stream':
+        # результаты не загружаются целиком: примеры читаются из файла при каждом проходе
+        count = sum(1 for _ in iter_file_examples(results_file, grades_data))
+        if not count:
+            print("Ошибка: Нет данных для обучения!")
+            return
+
+        print(f"Найдено {count} примеров для обучения")
 
-    print("Обучение модели оценки...")
-    model = train_model(text, gr)
+        print("Потоковое обучение модели оценки...")
+        model = train_streaming(results_file, grades_dir, grades_data, search, folds, n_jobs, epochs, batch_size)
+    else:
+        text, gr = prepare_data(parse_results(results_file), grades_data)
+
+        if not text:
+            print("Ошибка: Нет данных для обучения!")
+            return
+
+        print(f"Найдено {len(text)} примеров для обучения")
+
+        print("Обучение модели оценки...")
+        model = train_model(text, gr, search, folds, n_jobs)
 
     joblib.dump(model, MODEL_FILE)
     print(f"\nМодель сохранена в {MODEL_FILE}")
 
+    if export_dir:
+        export_linear_model(model, export_dir)
+        print(f"Массивы модели выгружены в {export_dir}")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Обучение модели для оценки работ.')
-    parser.add_argument('--results', type=str, required=True, help='Файл с результатами распознавания')
-    parser.add_argument('--grades', type=str, required=True, help='Папка с JSON-файлами оценок')
+    parser.add_argument('--results', type=str, help='Файл с результатами распознавания')
+    parser.add_argument('--grades', type=str, help='Папка с JSON-файлами оценок')
+    parser.add_argument('--mode', choices=['tfidf', 'stream'], default='tfidf',
+                        help='tfidf - TF-IDF и LogisticRegression в памяти, '
+                             'stream - HashingVectorizer и SGDClassifier.partial_fit по пачкам')
+    parser.add_argument('--search', action='store_true', help='Подобрать параметры k-fold кросс-валидацией')
+    parser.add_argument('--folds', type=int, default=5, help='Число фолдов кросс-валидации')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Процессов для кросс-валидации (-1 - все ядра)')
+    parser.add_argument('--epochs', type=int, default=STREAM_EPOCHS, help='Проходов по данным в режиме stream')
+    parser.add_argument('--batch-size', type=int, default=STREAM_BATCH_SIZE, help='Текстов в пачке partial_fit')
+    parser.add_argument('--per-task', action='store_true',
+                        help=f'Общий TF-IDF и отдельный классификатор на каждое задание в {MODEL_BUNDLE_FILE}')
+    parser.add_argument('--export', nargs='?', const=MODEL_EXPORT_DIR,
+                        help='Выгрузить массивы модели для быстрой загрузки в day5 '
+                             f'(без --results и --grades выгружается готовый {MODEL_FILE})')
 
     args = parser.parse_args()
+    if not (args.results and args.grades):
+        if not args.export:
+            parser.error('нужны --results и --grades или --export')
+        export_model(MODEL_FILE, args.export)
+        raise SystemExit
+    if args.export and (args.per_task or args.mode != 'tfidf'):
+        parser.error('--export поддерживает только модель tfidf')
+    if args.per_task and (args.mode != 'tfidf' or args.search):
+        parser.error('--per-task работает только в режиме tfidf без --search')
 
     main(
         results_file=args.results,
-        grades_dir=args.grades
+        grades_dir=args.grades,
+        mode=args.mode,
+        search=args.search,
+        folds=args.folds,
+        n_jobs=args.n_jobs,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        per_task=args.per_task,
+        export_dir=args.export
     )
\ No newline at end of file
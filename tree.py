@@ -1,34 +1,29 @@
+import argparse
 import re
 import tarfile
 import os
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from symspellpy import SymSpell, Verbosity
+from symspellpy import Verbosity
+
+from compact_index import load_or_build_compact_index
+from correction_cache import CorrectionCache
+from file_utils import file_sha256
+from spell_index import load_or_build_symspell
 
 ARCHIVE_PATH = 'school.tar.gz'
 OUTPUT_DIR = 'results'
 DICTIONARY_PATH = 'russian.utf-8'
+CACHE_SIZE = 100000
 
 
 def initialize_symspell(dict_path):
-    sym_spell = SymSpell(max_dictionary_edit_distance=2)
-
-    temp_freq_path = "temp_frequency_dict.txt"
-    with open(dict_path, 'r', encoding='utf-8') as f_in, \
-            open(temp_freq_path, 'w', encoding='utf-8') as f_out:
-        for line in f_in:
-            word = line.strip()
-            if word:
-                f_out.write(f"{word}\t1\n")
-
-    with open(temp_freq_path, 'r', encoding='utf-8') as temp_file:
-        sym_spell.load_dictionary_stream(temp_file, term_index=0, count_index=1)
-    os.remove(temp_freq_path)
+    return load_or_build_symspell(dict_path, max_dictionary_edit_distance=2, word_list=True)
 
-    return sym_spell
 
-
-def correct_text(text, sym_spell):
+def correct_text(text, cache):
     words = re.findall(r'\b[а-яё-]+\b', text.lower())
     unique_words = []
     seen = set()
@@ -41,42 +36,127 @@ def correct_text(text, sym_spell):
 
     corrected = []
     for word in unique_words:
-        suggestions = sym_spell.lookup(word, Verbosity.TOP, max_edit_distance=2)
-        corrected.append(suggestions[0].term if suggestions else word)
+        corrected.append(cache.correct(word, Verbosity.TOP, max_edit_distance=2))
 
     return corrected
 
 
-def process_tar_archive(archive_path, output_dir, dict_path):
-    sym_spell = initialize_symspell(dict_path)
-    os.makedirs(output_dir, exist_ok=True)
+def iter_archive_members(tar):
+    # архив читается потоком: каждый файл распаковывается один раз и по порядку
+    for member in tar:
+        if member.isfile() and member.name.endswith('.txt.webRes'):
+            yield member.name, tar.extractfile(member).read()
 
-    print("Обработка архива...")
 
-    with tarfile.open(archive_path, 'r:gz') as tar:
-        members = [m for m in tar if m.isfile() and m.name.endswith('.txt.webRes')]
+def write_corrected(output_dir, member_name, corrected_words):
+    input_stem = Path(member_name).stem.replace('.txt', '')
+    output_path = os.path.join(output_dir, f"{input_stem}_corrected.txt")
 
-        for member in members:
-            try:
-                content = tar.extractfile(member).read().decode('utf-8')
-                corrected_words = correct_text(content, sym_spell)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(corrected_words))
+
+
+_worker_cache = None
+
+
+def init_worker(dict_path, cache_path, cache_size):
+    # индекс загружается один раз на процесс; компактный индекс открывается через mmap
+    # и разделяется всеми процессами. Кеш у каждого процесса свой: с диска он только читается,
+    # а новые исправления уходят в главный процесс вместе с результатом файла
+    global _worker_cache
+    sym_spell = load_or_build_compact_index(dict_path, max_dictionary_edit_distance=2, word_list=True)
+    _worker_cache = CorrectionCache(sym_spell, cache_size, cache_path, version=file_sha256(dict_path))
+    _worker_cache.track_updates = True
 
-                input_stem = Path(member.name).stem.replace('.txt', '')
-                output_path = os.path.join(output_dir, f"{input_stem}_corrected.txt")
 
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(corrected_words))
+def correct_member(content):
+    corrected_words = correct_text(content.decode('utf-8'), _worker_cache)
+    return corrected_words, _worker_cache.take_updates()
+
+
+def process_tar_archive(archive_path, output_dir, dict_path, workers=1, cache_path=None, cache_size=CACHE_SIZE):
+    os.makedirs(output_dir, exist_ok=True)
+
+    if workers > 1:
+        process_tar_archive_parallel(archive_path, output_dir, dict_path, workers, cache_path, cache_size)
+        return
+
+    sym_spell = initialize_symspell(dict_path)
+    cache = CorrectionCache(sym_spell, cache_size, cache_path, version=file_sha256(dict_path))
+
+    print("Обработка архива...")
+
+    with tarfile.open(archive_path, 'r|gz') as tar:
+        for member_name, content in iter_archive_members(tar):
+            try:
+                corrected_words = correct_text(content.decode('utf-8'), cache)
+                write_corrected(output_dir, member_name, corrected_words)
 
             except Exception as e:
-                print(f"Ошибка в файле {member.name}: {str(e)}")
+                print(f"Ошибка в файле {member_name}: {str(e)}")
+
+    cache.save()
+    stats = cache.stats()
+    print(f"Кеш исправлений: попаданий {stats['hits']}, промахов {stats['misses']}, "
+          f"доля попаданий {stats['hit_rate']:.1%}")
+
+
+def process_tar_archive_parallel(archive_path, output_dir, dict_path, workers, cache_path=None,
+                                 cache_size=CACHE_SIZE):
+    # индекс строится заранее, чтобы процессы не строили его одновременно. Кеш главного
+    # процесса собирает исправления процессов-обработчиков и сохраняется в конце
+    sym_spell = load_or_build_compact_index(dict_path, max_dictionary_edit_distance=2, word_list=True)
+    cache = CorrectionCache(sym_spell, cache_size, cache_path, version=file_sha256(dict_path))
+
+    print(f"Обработка архива, процессов: {workers}...")
+
+    # не больше max_pending файлов в работе: чтение архива не убегает вперед
+    max_pending = workers * 4
+    pending = deque()
+
+    def write_next():
+        member_name, future = pending.popleft()
+        try:
+            corrected_words, updates = future.result()
+            cache.apply_updates(updates)
+            write_corrected(output_dir, member_name, corrected_words)
+        except Exception as e:
+            print(f"Ошибка в файле {member_name}: {str(e)}")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(dict_path, cache_path, cache_size)) as executor, \
+            tarfile.open(archive_path, 'r|gz') as tar:
+        for member_name, content in iter_archive_members(tar):
+            pending.append((member_name, executor.submit(correct_member, content)))
+            if len(pending) >= max_pending:
+                write_next()
+
+        while pending:
+            write_next()
+
+    cache.save()
+    sym_spell.close()
+    stats = cache.stats()
+    print(f"Кеш исправлений: попаданий {stats['hits']}, промахов {stats['misses']}, "
+          f"доля попаданий {stats['hit_rate']:.1%}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Исправление орфографии в архиве webRes-файлов.')
+    parser.add_argument('--archive', default=ARCHIVE_PATH, help='Архив с webRes-файлами')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='Папка для результатов')
+    parser.add_argument('--dictionary', default=DICTIONARY_PATH, help='Файл словаря')
+    parser.add_argument('--workers', type=int, default=1, help='Число процессов для исправления')
+    parser.add_argument('--cache', default=None, help='Файл для сохранения кеша исправлений между запусками')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='Максимальный размер кеша исправлений')
+
+    args = parser.parse_args()
+
     print("Начало обработки архива")
 
     start_time = time.time()
-    process_tar_archive(ARCHIVE_PATH, OUTPUT_DIR, DICTIONARY_PATH)
+    process_tar_archive(args.archive, args.output, args.dictionary, args.workers, args.cache, args.cache_size)
 
     print("\n" + "=" * 50)
     print(f"Готово. Время обработки: {time.time() - start_time:.2f} сек")
-    print(f"Результаты в: {os.path.abspath(OUTPUT_DIR)}")
\ No newline at end of file
+    print(f"Результаты в: {os.path.abspath(args.output)}")
\ No newline at end of file
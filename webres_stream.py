@@ -0,0 +1,167 @@
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+
+TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<punct>[{}\[\]:,])
+      | (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<number>-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?)
+      | (?P<literal>true|false|null)
+    )''', re.VERBOSE)
+
+DELIMITERS = frozenset(' \t\r\n,]}')
+LITERALS = {'true': True, 'false': False, 'null': None}
+BOX_KEYS = ('x', 'y', 'w', 'h')
+
+
+def iter_tokens(f, chunk_size=CHUNK_SIZE):
+    # токены JSON из файла, который читается кусками: целиком в память он не загружается
+    buffer = ''
+    pos = 0
+    eof = False
+
+    while True:
+        match = TOKEN_PATTERN.match(buffer, pos)
+        # токен на границе куска может быть неполным - дочитываем файл;
+        # число или литерал считаются законченными только перед разделителем
+        if not eof and (match is None or match.end() == len(buffer)
+                        or match.lastgroup in ('number', 'literal') and buffer[match.end()] not in DELIMITERS):
+            chunk = f.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            continue
+
+        if match is None:
+            if buffer[pos:].strip():
+                raise ValueError(f"Некорректный JSON рядом с: {buffer[pos:pos + 40]!r}")
+            return
+
+        pos = match.end()
+        kind = match.lastgroup
+        token = match.group(kind)
+
+        if kind == 'string':
+            yield kind, json.loads(token) if '\\' in token else token[1:-1]
+        elif kind == 'number':
+            yield kind, float(token) if any(c in token for c in '.eE') else int(token)
+        elif kind == 'literal':
+            yield kind, LITERALS[token]
+        else:
+            yield kind, token
+
+
+def iter_json_events(f, chunk_size=CHUNK_SIZE):
+    # события в духе ijson: start_map, map_key, end_map, start_array, end_array, value
+    containers = []
+    expect_key = False
+
+    for kind, token in iter_tokens(f, chunk_size):
+        if kind == 'punct':
+            if token == '{':
+                containers.append('map')
+                expect_key = True
+                yield 'start_map', None
+            elif token == '[':
+                containers.append('array')
+                yield 'start_array', None
+            elif token == '}':
+                containers.pop()
+                expect_key = False
+                yield 'end_map', None
+            elif token == ']':
+                containers.pop()
+                yield 'end_array', None
+            elif token == ',':
+                expect_key = containers[-1] == 'map'
+        elif expect_key:
+            expect_key = False
+            yield 'map_key', token
+        else:
+            yield 'value', token
+
+    if containers:
+        raise ValueError("Некорректный JSON: файл оборван")
+
+
+def iter_text_boxes(f, lang='rus', chunk_size=CHUNK_SIZE):
+    # выдает боксы {'x', 'y', 'w', 'h', 'text'} для текстов на языке lang в том же порядке,
+    # что рекурсивный обход json.load: сначала тексты элемента, затем тексты вложенных элементов.
+    # Координаты в webRes идут после 'languages', поэтому боксы элемента готовы только при его
+    # закрытии; до этого боксы вложенных элементов копятся в 'boxes' элемента (по буферу на
+    # уровень) и уходят выше вслед за его собственными. Элемент внешнего списка 'blocks' отдает
+    # боксы сразу при закрытии: над ним только оболочка документа ({"data": ...}) без текстов
+    stack = []
+    in_blocks = False
+
+    for event, value in iter_json_events(f, chunk_size):
+        if event == 'map_key':
+            stack[-1]['key'] = value
+
+        elif event == 'value':
+            frame = stack[-1] if stack else None
+            if frame is None or frame['type'] != 'map':
+                continue
+            key = frame['key']
+            if key in BOX_KEYS:
+                frame['box'][key] = value
+            elif key == 'lang' and frame['role'] == 'language':
+                frame['lang'] = value
+            elif key == 'text' and frame['role'] == 'text':
+                frame['text'] = value
+
+        elif event == 'start_map':
+            parent = stack[-1] if stack else None
+            role = parent['role'] if parent and parent['type'] == 'array' else None
+            stack.append({'type': 'map', 'key': None, 'role': role, 'box': {},
+                          'texts': [], 'lang': None, 'text': None, 'boxes': []})
+
+        elif event == 'start_array':
+            parent = stack[-1] if stack else None
+            role = None
+            if parent and parent['type'] == 'map':
+                if parent['key'] == 'blocks' and not in_blocks:
+                    role = 'blocks'
+                    in_blocks = True
+                elif parent['key'] == 'languages':
+                    role = 'language'
+                elif parent['key'] == 'texts' and parent['role'] == 'language':
+                    role = 'text'
+            stack.append({'type': 'array', 'role': role})
+
+        elif event == 'end_array':
+            if stack.pop()['role'] == 'blocks':
+                in_blocks = False
+
+        elif event == 'end_map':
+            frame = stack.pop()
+            # элемент -> список languages -> язык -> список texts -> текст
+            if frame['role'] == 'text':
+                text = frame['text']
+                if isinstance(text, str) and text.strip():
+                    stack[-2]['texts'].append(text.strip())
+            elif frame['role'] == 'language':
+                if frame['lang'] == lang:
+                    stack[-2]['texts'].extend(frame['texts'])
+                frame['texts'] = []
+
+            box = frame['box']
+            boxes = [{
+                'x': box.get('x', 0),
+                'y': box.get('y', 0),
+                'w': box.get('w', 0),
+                'h': box.get('h', 0),
+                'text': text
+            } for text in frame['texts']]
+            boxes.extend(frame['boxes'])
+
+            if boxes and frame['role'] == 'blocks':
+                yield from boxes
+            elif boxes:
+                parent = next((parent for parent in reversed(stack) if parent['type'] == 'map'), None)
+                if parent is not None:
+                    parent['boxes'].extend(boxes)
+                else:
+                    yield from boxes